@@ -0,0 +1,218 @@
+import numpy as np
+
+from columnar import _encode_strings
+from models import Purchase, Sales
+from utils import load_ops_columns, load_ops_list
+from settings import *
+
+PARTY_FIELDS = {Purchase: 'vendor', Sales: 'client'}
+PRICE_FIELDS = {Purchase: '_price', Sales: 'total_price'}
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return -1
+
+
+# 某一列的索引: 按编码排序后的行号, 以及每个编码在其中的起止位置(编码 -1 表示空值)
+class Index:
+
+    def __init__(self, codes, size):
+        shifted = np.asarray(codes, dtype=np.int64) + 1
+        self.order = np.argsort(shifted, kind='stable')
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(shifted, minlength=size + 1))))
+
+    def rows(self, code):
+        return self.order[self.offsets[code + 1]:self.offsets[code + 2]]
+
+    def counts(self):
+        return np.diff(self.offsets)[1:]
+
+
+# 采购/销售数据的列式视图: 编号、供应商/客户、年月和匹配方式按编码保存并建立索引,
+# 数量和金额为 float64 数组, 筛选和分组汇总都在 numpy 中完成.
+# 供应商和客户统一称为 party.
+class TransactionTable:
+
+    def __init__(self, model_class, strings, codes, year, month, amount, price, candidates):
+        self.model_class = model_class
+        self.strings = strings
+        self.codes = codes
+        self.year = year
+        self.month = month
+        self.amount = amount
+        self.price = price
+        self.candidates = candidates
+        self.lookup = {field: {value: code for code, value in enumerate(table)} for field, table in strings.items()}
+
+        # (年, 月)编码为从 0 开始的序号, 与 periods 一一对应
+        period = np.where((year >= 0) & (month >= 0), year * 12 + month, -1)
+        self.periods, inverse = np.unique(period, return_inverse=True)
+        self.period_codes = inverse.astype(np.int32)
+        if len(self.periods) and self.periods[0] < 0:
+            self.periods = self.periods[1:]
+            self.period_codes -= 1
+        self.indexes = {
+            'serial': Index(codes['serial'], len(strings['serial'])),
+            'party': Index(codes['party'], len(strings['party'])),
+            'period': Index(self.period_codes, len(self.periods)),
+        }
+
+    def __len__(self):
+        return len(self.amount)
+
+    @classmethod
+    def from_items(cls, items, model_class):
+        party_field, price_field = PARTY_FIELDS[model_class], PRICE_FIELDS[model_class]
+        strings, codes = {}, {}
+        for field, attr in (('serial', 'serial'), ('party', party_field), ('match_type', 'match_type')):
+            strings[field], codes[field] = _encode_strings([getattr(item, attr, None) for item in items])
+        return cls(
+            model_class, strings, codes,
+            year=np.array([_to_int(item.year) for item in items], dtype=np.int64),
+            month=np.array([_to_int(item.month) for item in items], dtype=np.int64),
+            amount=np.array([_to_float(item.amount) for item in items], dtype=np.float64),
+            price=np.array([_to_float(getattr(item, price_field)) for item in items], dtype=np.float64),
+            candidates=np.array([len(item.potential_matches) for item in items], dtype=np.int64),
+        )
+
+    @classmethod
+    def from_columns(cls, store):
+        # 按列存储时直接使用已保存的编码, 不生成数据对象
+        model_class = store.model_class
+        strings, codes = {}, {}
+        for field, column in (('serial', 'serial'), ('party', PARTY_FIELDS[model_class]),
+                              ('match_type', 'match_type')):
+            codes[field], strings[field] = store._strings(column)
+            codes[field] = np.asarray(codes[field])
+        return cls(
+            model_class, strings, codes,
+            year=np.asarray(store.column('year'), dtype=np.int64),
+            month=np.asarray(store.column('month'), dtype=np.int64),
+            amount=np.asarray(store.column('amount'), dtype=np.float64),
+            price=np.asarray(store.column(PRICE_FIELDS[model_class]), dtype=np.float64),
+            candidates=store.candidate_counts(),
+        )
+
+    # ==============筛选================
+
+    def _index_rows(self, field, value):
+        code = self.lookup[field].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        return self.indexes[field].rows(code)
+
+    def select(self, serial=None, party=None, year=None, month=None, matched=None):
+        # 返回满足条件的行号(升序); 有索引的条件先取索引, 其余条件再逐列过滤
+        rows = None
+        if serial is not None:
+            rows = self._index_rows('serial', serial)
+        if party is not None:
+            found = self._index_rows('party', party)
+            rows = found if rows is None else np.intersect1d(rows, found)
+        if year is not None and month is not None:
+            period = np.searchsorted(self.periods, int(year) * 12 + int(month))
+            if period < len(self.periods) and self.periods[period] == int(year) * 12 + int(month):
+                found = self.indexes['period'].rows(period)
+            else:
+                found = np.empty(0, dtype=np.int64)
+            rows = found if rows is None else np.intersect1d(rows, found)
+            year = month = None
+        if rows is None:
+            rows = np.arange(len(self))
+        else:
+            rows = np.sort(rows)
+
+        mask = np.ones(len(rows), dtype=bool)
+        if year is not None:
+            mask &= self.year[rows] == int(year)
+        if month is not None:
+            mask &= self.month[rows] == int(month)
+        if matched is not None:
+            mask &= (self.codes['serial'][rows] >= 0) == bool(matched)
+        return rows[mask]
+
+    # ==============汇总================
+
+    def _key_codes(self, field):
+        # 返回(编码, 取值表); 编码 -1 对应空值
+        if field == 'year' or field == 'month':
+            values = self.year if field == 'year' else self.month
+            table, codes = np.unique(values, return_inverse=True)
+            table = [None if value < 0 else int(value) for value in table]
+            return codes, table
+        return self.codes[field], self.strings[field]
+
+    def group_by(self, by, rows=None):
+        # 按 by 中的字段(serial/party/year/month/match_type)分组, 汇总行数、数量和金额;
+        # 结果按金额从大到小排列
+        if isinstance(by, str):
+            by = (by,)
+        if rows is None:
+            rows = np.arange(len(self))
+        keys = [self._key_codes(field) for field in by]
+        if not len(rows):
+            return []
+
+        shape = [len(table) + 1 for codes, table in keys]
+        combined = np.ravel_multi_index([np.asarray(codes)[rows] + 1 for codes, table in keys], shape)
+        groups, inverse = np.unique(combined, return_inverse=True)
+        counts = np.bincount(inverse)
+        amount = np.bincount(inverse, weights=np.nan_to_num(self.amount[rows]))
+        price = np.bincount(inverse, weights=np.nan_to_num(self.price[rows]))
+
+        positions = np.unravel_index(groups, shape)
+        result = []
+        for i, (count, total_amount, total_price) in enumerate(zip(counts, amount, price)):
+            row = {field: None if position[i] == 0 else table[position[i] - 1]
+                   for field, (codes, table), position in zip(by, keys, positions)}
+            row.update(
+                count=int(count),
+                amount=float(total_amount),
+                price=float(total_price),
+                unit_price=float(total_price / total_amount) if total_amount else None,
+            )
+            result.append(row)
+        result.sort(key=lambda row: -row['price'])
+        return result
+
+    def total(self, rows=None):
+        if rows is None:
+            rows = np.arange(len(self))
+        return {
+            'count': int(len(rows)),
+            'amount': float(np.nansum(self.amount[rows])),
+            'price': float(np.nansum(self.price[rows])),
+        }
+
+    def match_stats(self):
+        has_serial = self.codes['serial'] >= 0
+        count_has_serial = int(has_serial.sum())
+        count_has_potential = int(((~has_serial) & (self.candidates > 1)).sum())
+        # 匹配方式只统计已匹配的行
+        match_types = np.bincount(self.codes['match_type'][has_serial] + 1,
+                                  minlength=len(self.strings['match_type']) + 1)[1:]
+        match_types = dict(zip(self.strings['match_type'], match_types.tolist()))
+        return {
+            'rows': len(self),
+            'has_serial': count_has_serial,
+            'has_potential': count_has_potential,
+            'no_match': len(self) - count_has_serial - count_has_potential,
+            'exact': match_types.get(MATCH_EXACT, 0) + match_types.get(MATCH_NAME_MANUFACTURER, 0),
+            'fuzzy': match_types.get(MATCH_FUZZY, 0),
+        }
+
+def load_tables():
+    if STORAGE_BACKEND == 'columnar':
+        return tuple(TransactionTable.from_columns(load_ops_columns(target)) for target in ('purchase', 'sales'))
+    purchase_list, sales_list = load_ops_list()
+    return TransactionTable.from_items(purchase_list, Purchase), TransactionTable.from_items(sales_list, Sales)
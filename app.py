@@ -1,57 +1,46 @@
-from models import show_progress
+from analytics import load_tables
+from journal import MatchJournal
+from matcher import Matcher
+from metrics import METRICS
+from models import set_progress, show_progress
+from pipeline import Pipeline
+from sqlstore import SqliteMatchLog
 from utils import *
 
 
-def display_stats():
-    purchase_list, sales_list = load_ops_list()
-    print("=============数据统计=============\n")
-    count_has_serial, count_has_potential = 0, 0
-    for i in purchase_list:
-        if i.has_serial():
-            count_has_serial += 1
-            continue
-        if len(i.potential_matches) > 1:
-            count_has_potential += 1
-    print("采购数据共{}项".format(len(purchase_list)))
-    print("成功匹配: {}\t\t有候选: {}\t\t几乎无匹配: {}\n".format(
-        count_has_serial,
-        count_has_potential,
-        len(purchase_list) - count_has_serial - count_has_potential
+def _print_match_stats(title, table):
+    stats = table.match_stats()
+    print("{}数据共{}项".format(title, stats['rows']))
+    print("成功匹配: {}\t\t有候选: {}\t\t几乎无匹配: {}".format(
+        stats['has_serial'], stats['has_potential'], stats['no_match']
     ))
+    print("其中精确命中: {}\t\t模糊命中: {}\n".format(stats['exact'], stats['fuzzy']))
 
-    count_has_serial, count_has_potential = 0, 0
-    for i in sales_list:
-        if i.has_serial():
-            count_has_serial += 1
-            continue
-        if len(i.potential_matches) > 1:
-            count_has_potential += 1
-    print("销售数据共{}项".format(len(sales_list)))
-    print("成功匹配: {}\t\t有候选: {}\t\t几乎无匹配: {}\n".format(
-        count_has_serial,
-        count_has_potential,
-        len(sales_list) - count_has_serial - count_has_potential
-    ))
+
+def display_stats():
+    print("=============数据统计=============\n")
+    # 按列存储时只读取需要的列, 不生成数据对象(见 analytics.load_tables)
+    for table, title in zip(load_tables(), ("采购", "销售")):
+        _print_match_stats(title, table)
 
 
 def handle_matches():
 
     def write_errors(ops_list, error_type, file_prefix):
-        count, buff, num = 0, [], 1
+        buff, num = [], 1
         for i in ops_list:
             if i.has_serial():
                 continue
             buff.append(i)
-            count += 1
-            if count >= 500:
+            if len(buff) >= SUGGESTION_ITEMS_PER_FILE:
                 file_name = "{}{}.xlsx".format(file_prefix, num)
-                write_match_errors(buff, file_name)
-                count = 0
+                write_match_errors(buff, error_type, file_name)
                 buff = []
                 num += 1
 
-        file_name = "{}{}.xlsx".format(file_prefix, num)
-        write_match_errors(buff, error_type, file_name)
+        if buff or num == 1:
+            file_name = "{}{}.xlsx".format(file_prefix, num)
+            write_match_errors(buff, error_type, file_name)
 
     purchase_list, sales_list = load_ops_list()
 
@@ -64,101 +53,129 @@ def handle_matches():
     write_errors(sales_list, '销售', sales_error_file)
 
 
-def match_purchases(auto_save=False):
-    products = load_products()
+def _match_ops_list(ops_list, data_file, matcher, auto_save=False, workers=MATCH_WORKERS):
+    # 上次中断时未并入数据文件的匹配结果先从日志中恢复; SQLite 存储时匹配结果分批直接写入数据库
+    if STORAGE_BACKEND == 'sqlite':
+        journal = SqliteMatchLog(open_store(), ops_list, OPS_MODELS[data_file])
+    else:
+        journal = MatchJournal(data_file)
+    replayed = journal.replay(ops_list, matcher.products)
+    pending = [item for item in ops_list if not item.has_serial() and id(item) not in replayed]
+    num_items = len(pending)
+    if workers > 1:
+        print("\t使用{}个进程并行匹配{}项未编码纪录".format(workers, num_items))
+
+    def on_item(item):
+        journal.record(item)
+        if journal.records >= JOURNAL_COMPACT_EVERY:
+            journal.compact(ops_list)
+            matcher.save_cache()
+
+    def on_progress(done):
+        show_progress(done, num_items)
+
+    if num_items:
+        show_progress(0, num_items)
+        with METRICS.stage('match', rows=num_items):
+            matcher.match_all(pending, workers=workers, on_progress=on_progress,
+                              on_item=on_item if auto_save else None)
+    journal.compact(ops_list)
+    journal.close()
+    matcher.save_cache()
+    matcher.report()
+
+
+def match_purchases(auto_save=False, matcher=None, workers=MATCH_WORKERS, scorer='difflib'):
+    if matcher is None:
+        catalog = load_catalog()
+        matcher = Matcher(catalog.products(), scorer=scorer, catalog=catalog)
     purchase_list, _ = load_ops_list(target='purchase')
 
     print("开始对应采购商品系统编码, 共{}项纪录...\n".format(len(purchase_list)))
-    num_purchases = len(purchase_list)
-    show_progress(0, num_purchases)
-    for i, item in enumerate(purchase_list):
-        if (i + 1) % 5 == 0:
-            show_progress(i + 1, num_purchases)
-        if auto_save and i > 0 and i % 500 == 0:
-            save_data(purchase_list, PURCHASE_FILE)
-
-        if item.has_serial():  # or len(item.potential_matches):
-            continue
-
-        item.potential_matches = []
-
-        best_match, best_similarity = None, 0
-        for product in products:
-            result = item.match_product(product)
-            if item.has_serial():
-                break
-            if result is not None and result > best_similarity:
-                best_similarity = result
-                best_match = product
-        if not len(item.potential_matches):
-            item.potential_matches.append(best_match)
-    save_data(purchase_list, PURCHASE_FILE)
-
-
-def match_sales(auto_save=False):
-    products = load_products()
+    _match_ops_list(purchase_list, PURCHASE_FILE, matcher, auto_save=auto_save, workers=workers)
+
+
+def match_sales(auto_save=False, matcher=None, workers=MATCH_WORKERS, scorer='difflib'):
+    if matcher is None:
+        catalog = load_catalog()
+        matcher = Matcher(catalog.products(), scorer=scorer, catalog=catalog)
     _, sales_list = load_ops_list(target='sales')
 
     print('开始对应销售商品系统编码, 共{}项纪录...\n'.format(len(sales_list)))
-    num_sales = len(sales_list)
-    show_progress(0, num_sales)
-    for i, item in enumerate(sales_list):
-        if (i + 1) % 5 == 0:
-            show_progress(i + 1, num_sales)
-        if auto_save and i > 0 and i % 500 == 0:
-            save_data(sales_list, SALES_FILE)
-
-        if item.has_serial():  # or len(item.potential_matches):
-            continue
-
-        item.potential_matches = []
-
-        best_match, best_similarity = None, 0
-        for product in products:
-            result = item.match_product(product)
-            if item.has_serial():
-                break
-            if result is not None and result > best_similarity:
-                best_similarity = result
-                best_match = product
-        if not len(item.potential_matches):
-            item.potential_matches.append(best_match)
-    save_data(sales_list, SALES_FILE)
+    _match_ops_list(sales_list, SALES_FILE, matcher, auto_save=auto_save, workers=workers)
 
 
 def preprocess(save=False):
-    p, s = load_ops_list(reload=False)
-    for i in p:
-        i.normalize_product_info()
-        i.validate_data()
-    for i in s:
-        i.normalize_product_info()
-        i.validate_data()
+    with METRICS.stage('ingest') as stage:
+        p, s = load_ops_list(reload=False)
+        stage['rows'] = len(p) + len(s)
+    with METRICS.stage('preprocess', rows=len(p) + len(s)):
+        for i in p:
+            i.normalize_product_info()
+            i.validate_data()
+        for i in s:
+            i.normalize_product_info()
+            i.validate_data()
     if save:
         save_data(p, PURCHASE_FILE)
         save_data(s, SALES_FILE)
 
 
-def match_serial_main():
+def match_serial_main(workers=MATCH_WORKERS, scorer='difflib', progress=SHOW_PROGRESS):
+    set_progress(progress)
+    METRICS.reset()
     init()
     preprocess()
-    match_purchases()
-    match_sales()
-    handle_matches()
+    with METRICS.stage('catalog') as stage:
+        catalog = load_catalog()
+        matcher = Matcher(catalog.products(), scorer=scorer, catalog=catalog)
+        stage['rows'] = len(matcher.products)
+    match_purchases(matcher=matcher, workers=workers)
+    match_sales(matcher=matcher, workers=workers)
+    METRICS.record_matcher(matcher)
+    with METRICS.stage('error_reports'):
+        handle_matches()
     display_stats()
+    METRICS.report()
+    METRICS.save()
 
 
-def dump_sheet_main():
+def dump_sheet_main(workers=EXPORT_WORKERS, progress=SHOW_PROGRESS):
+    set_progress(progress)
+    METRICS.reset()
     preprocess(save=True)
-    p, s = load_ops_list(target='both', reload=False)
-    p = list(filter(lambda x: x.has_serial(), p))
-    s = list(filter(lambda x: x.has_serial(), s))
+    p, s = load_matched_lists()
     s = list(filter(lambda x: float(x.total_price) >= 0, s))
     p = list(filter(lambda x: isinstance(x.vendor, str), p))
     s = list(filter(lambda x: isinstance(x.client, str), s))
+    with METRICS.stage('export', rows=len(p) + len(s)):
+        clear_output_dirs()
+        batch_purchases(p, workers=workers)
+        group_sales(s, workers=workers)
+    METRICS.report()
+    METRICS.save()
+
+
+def pipeline_main(match_workers=MATCH_WORKERS, export_workers=EXPORT_WORKERS, scorer='difflib',
+                  progress=SHOW_PROGRESS):
+    # 读取、匹配、写出同时进行: 直接从源文件读取, 结果保存到数据文件,
+    # 同时生成整理建议和导出表
+    set_progress(progress)
+    METRICS.reset()
+    init()
     clear_output_dirs()
-    batch_purchases(p)
-    group_sales(s)
+    with METRICS.stage('catalog') as stage:
+        catalog = load_catalog()
+        matcher = Matcher(catalog.products(), scorer=scorer, catalog=catalog)
+        stage['rows'] = len(matcher.products)
+    purchase_sheets, sales_sheets = preprocess_sheets()
+    pipeline = Pipeline(matcher, match_workers=match_workers, export_workers=export_workers)
+    pipeline.run(purchase_sheets, sales_sheets)
+    matcher.report()
+    METRICS.record_matcher(matcher)
+    display_stats()
+    METRICS.report()
+    METRICS.save()
 
 
 def test():
@@ -0,0 +1,61 @@
+# 统计查询用时: 在已保存的采购/销售数据上建立 TransactionTable, 测量建表和几类常用查询的用时,
+# 并与逐个数据对象遍历的写法对比
+# 用法(在项目根目录): python -m benchmarks.analytics [倍数]   倍数 > 1 时将数据复制多份模拟更大的数据量
+import contextlib
+import io
+import sys
+import time
+from collections import defaultdict
+
+from analytics import PARTY_FIELDS, PRICE_FIELDS, TransactionTable
+from models import Purchase, Sales
+from utils import load_ops_list
+
+
+def timed(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def scan_group_by(items, model_class):
+    party, price = PARTY_FIELDS[model_class], PRICE_FIELDS[model_class]
+    groups = defaultdict(lambda: [0, 0.0, 0.0])
+    for item in items:
+        group = groups[(getattr(item, party), item.month)]
+        group[0] += 1
+        group[1] += float(item.amount)
+        group[2] += float(getattr(item, price))
+    return groups
+
+
+def main(scale):
+    with contextlib.redirect_stdout(io.StringIO()):
+        purchase_list, sales_list = load_ops_list()
+    print("{:<34}{:>10}{:>12}".format("查询", "行数", "用时(毫秒)"))
+    for items, model_class in ((purchase_list * scale, Purchase), (sales_list * scale, Sales)):
+        name = model_class.__name__
+        elapsed, table = timed(lambda: TransactionTable.from_items(items, model_class), repeat=1)
+        serial = next((item.serial for item in items if item.serial), None)
+        party = getattr(items[0], PARTY_FIELDS[model_class])
+        queries = [
+            ('build', lambda: table),
+            ('match_stats', table.match_stats),
+            ('group_by(party, month)', lambda: table.group_by(('party', 'month'))),
+            ('group_by(serial)', lambda: table.group_by('serial')),
+            ('select(serial)', lambda: table.select(serial=serial)),
+            ('select(party, matched)', lambda: table.group_by('month', table.select(party=party, matched=False))),
+            ('scan group_by', lambda: scan_group_by(items, model_class)),
+        ]
+        for query, func in queries:
+            if query != 'build':
+                elapsed, _ = timed(func)
+            print("{:<34}{:>10}{:>12.2f}".format(name + ' ' + query, len(items), 1000 * elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1)
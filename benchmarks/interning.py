@@ -0,0 +1,50 @@
+# 字符串池的效果: 分别在关闭/开启字符串池时读取数据文件, 比较对象占用的内存、
+# 重新保存后的 pickle 大小和读取用时
+# 用法(在项目根目录): python -m benchmarks.interning [数据文件 ...]
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+import models
+from settings import *
+
+
+def measure(path, pooled):
+    intern_fields = models.Item.intern_fields
+    if not pooled:
+        models.Item.intern_fields = lambda self: None
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        tracemalloc.start()
+        start = time.perf_counter()
+        items = pickle.loads(data)
+        elapsed = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        size = len(pickle.dumps(items, pickle.HIGHEST_PROTOCOL))
+    finally:
+        models.Item.intern_fields = intern_fields
+    distinct = {field: len({getattr(item, field) for item in items})
+                for field in items[0].pooled_slots()} if items else {}
+    return {'rows': len(items), 'memory': memory, 'pickle': size, 'seconds': elapsed, 'distinct': distinct}
+
+
+def main(paths):
+    print("{:<24}{:>8}{:>14}{:>14}{:>12}".format("数据文件", "字符串池", "内存(MB)", "pickle(MB)", "读取(秒)"))
+    for path in paths:
+        results = [measure(path, pooled) for pooled in (False, True)]
+        for pooled, result in zip(("关闭", "开启"), results):
+            print("{:<24}{:>8}{:>14.2f}{:>14.2f}{:>12.3f}".format(
+                os.path.basename(path), pooled, result['memory'] / 2 ** 20, result['pickle'] / 2 ** 20,
+                result['seconds']))
+        before, after = results
+        print("\t原文件{:.2f}MB, 内存减少{:.0%}, pickle减少{:.0%}; {}行, 各字段不同取值数: {}\n".format(
+            os.path.getsize(path) / 2 ** 20, 1 - after['memory'] / before['memory'],
+            1 - after['pickle'] / before['pickle'], after['rows'], after['distinct']))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or [PURCHASE_FILE, SALES_FILE])
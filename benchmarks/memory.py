@@ -0,0 +1,45 @@
+# 对比旧版(__dict__)与 __slots__ 数据对象的内存占用
+# 用法(在项目根目录): python -m benchmarks.memory
+import pickle
+import tracemalloc
+
+import models  # 预先导入, 避免导入模块的内存计入第一次测量
+from settings import *
+
+
+class LegacyRecord:
+    # 与旧版 Item 相同: 每个实例的字段都存放在 __dict__ 中
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class LegacyUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        if module == 'models':
+            return type(name, (LegacyRecord,), {})
+        return super().find_class(module, name)
+
+
+def measure(file_name, legacy):
+    tracemalloc.start()
+    with open(file_name, 'rb') as fin:
+        unpickler = LegacyUnpickler(fin) if legacy else pickle.Unpickler(fin)
+        data = unpickler.load()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(data), used
+
+
+def main():
+    print("{:<24}{:>8}{:>16}{:>16}{:>10}".format("文件", "行数", "旧版 字节/行", "slots 字节/行", "节省"))
+    for file_name in (PURCHASE_FILE, SALES_FILE):
+        rows, before = measure(file_name, legacy=True)
+        _, after = measure(file_name, legacy=False)
+        print("{:<24}{:>8}{:>16.0f}{:>16.0f}{:>9.1f}%".format(
+            file_name, rows, before / rows, after / rows, 100 * (before - after) / before
+        ))
+
+
+if __name__ == '__main__':
+    main()
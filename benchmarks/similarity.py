@@ -0,0 +1,132 @@
+# 相似度算法对比: 在真实数据的(数据, 候选商品)对上比较 SequenceMatcher.ratio 与位并行 Indel 相似度的
+# 得分差异、阈值判断的一致性和单次比较用时, 并分别用两种算法做一遍模糊匹配比较结果
+# 用法(在项目根目录): python -m benchmarks.similarity [商品描述数]
+import contextlib
+import io
+import sys
+import time
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from matcher import Matcher
+from similarity import IndelPattern
+from utils import load_catalog, load_ops_list
+from settings import *
+
+FIELDS = ('name', 'dose', 'manufacturer', 'info')
+
+
+def sample_pairs(items, matcher, keys):
+    seen, pairs = set(), []
+    for item in items:
+        if item.product_key in seen:
+            continue
+        seen.add(item.product_key)
+        for product in matcher.candidates(item):
+            pairs.append((item, product))
+        if len(seen) >= keys:
+            break
+    return pairs
+
+
+def decision(score, field):
+    if field != 'info':
+        return score >= MATCH_THRESHOLDS['field']
+    if score >= MATCH_THRESHOLDS['overall']:
+        return 2
+    return 1 if score >= MATCH_THRESHOLDS['potential'] else 0
+
+
+def agreement(pairs):
+    print("{:<14}{:>10}{:>12}{:>12}{:>12}{:>12}{:>12}".format(
+        "字段", "比较次数", "得分相同", "平均差", "最大差", "相关系数", "判断一致"))
+    for field in FIELDS:
+        a, b = [], []
+        for item, product in pairs:
+            this, that = item.similarity_fields()[field], product.similarity_fields()[field]
+            a.append(SequenceMatcher(None, this, that).ratio())
+            b.append(item.pattern(field).ratio(that))
+        a, b = np.array(a), np.array(b)
+        same = np.mean([decision(x, field) == decision(y, field) for x, y in zip(a, b)])
+        print("{:<14}{:>10}{:>11.1%}{:>12.4f}{:>12.4f}{:>12.4f}{:>11.2%}".format(
+            field, len(a), np.mean(np.isclose(a, b)), np.mean(b - a), np.max(b - a), np.corrcoef(a, b)[0, 1], same))
+    print()
+
+
+def per_comparison(pairs):
+    texts = [(item.similarity_fields()['info'], product.similarity_fields()['info']) for item, product in pairs]
+
+    def fresh():
+        for this, that in texts:
+            SequenceMatcher(None, this, that).ratio()
+
+    def cached():
+        # 与匹配时相同: 商品一侧的 SequenceMatcher 复用, 只替换 seq1
+        for item, product in pairs:
+            matcher = product.matcher('info')
+            matcher.set_seq1(item.similarity_fields()['info'])
+            matcher.ratio()
+
+    patterns = [(IndelPattern(this), that) for this, that in texts]
+
+    def indel():
+        for pattern, that in patterns:
+            pattern.ratio(that)
+
+    print("{:<32}{:>14}".format("方式", "每次比较(微秒)"))
+    for name, func in (("SequenceMatcher(每次新建)", fresh), ("SequenceMatcher(复用 seq2)", cached),
+                       ("Indel(预先计算位掩码)", indel)):
+        best = min(timed(func) for _ in range(3))
+        print("{:<32}{:>14.2f}".format(name, 1e6 * best / len(pairs)))
+    print()
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def end_to_end(items, products, catalog, keys):
+    seen, sample = set(), []
+    for item in items:
+        if item.product_key not in seen:
+            seen.add(item.product_key)
+            sample.append(item)
+    sample = sample[:keys]
+    results = {}
+    for kernel in ('difflib', 'indel'):
+        for item in sample:
+            item.serial = None
+            item.clear_suggestions()
+        matcher = Matcher(products, use_exact=False, cache_file=None, catalog=catalog, kernel=kernel)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            matcher.match_all(sample)
+        elapsed = time.perf_counter() - start
+        results[kernel] = [(item.serial, [p.serial for p in item.suggestions()]) for item in sample]
+        print("{:<10}匹配{}组商品描述(不使用精确索引), 用时{:.2f}秒, 匹配{}组".format(
+            kernel, len(sample), elapsed, sum(1 for serial, _ in results[kernel] if serial)))
+    same = sum(1 for x, y in zip(results['difflib'], results['indel']) if x[0] == y[0])
+    top = sum(1 for x, y in zip(results['difflib'], results['indel']) if x[1][:1] == y[1][:1])
+    print("匹配编码一致: {}/{}, 首位候选一致: {}/{}\n".format(same, len(sample), top, len(sample)))
+
+
+def main(keys):
+    with contextlib.redirect_stdout(io.StringIO()):
+        catalog = load_catalog()
+        products = catalog.products()
+        purchase_list, sales_list = load_ops_list()
+    items = purchase_list + sales_list
+    for item in items:
+        item.normalize_product_info()
+    matcher = Matcher(products, cache_file=None, catalog=catalog)
+    pairs = sample_pairs(items, matcher, keys)
+    agreement(pairs)
+    per_comparison(pairs)
+    end_to_end(items, products, catalog, keys)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
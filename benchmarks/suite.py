@@ -0,0 +1,168 @@
+# 端到端性能测试: 用模拟数据分别测量读取、预处理、匹配和导出四个阶段的
+# 用时(墙钟/CPU)与峰值内存, 结果写入 JSON 文件, 便于对比不同版本
+# 用法(在项目根目录): python -m benchmarks.suite --rows 10000 [--catalog 20000] [--output 结果.json]
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import utils
+from benchmarks.synthetic import generate_catalog, generate_workbooks
+from matcher import Matcher
+from models import Purchase, Sales, SourceFile
+from settings import *
+
+
+def _reset_peak_rss():
+    # Linux 下写入 clear_refs 可重置 VmHWM, 使每个阶段单独统计峰值
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Stage:
+
+    def __init__(self, results, name, rows, trace_memory=False):
+        self.results = results
+        self.name = name
+        self.rows = rows
+        self.trace_memory = trace_memory
+
+    def __enter__(self):
+        _reset_peak_rss()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        self.devnull = open(os.devnull, 'w')
+        self.redirect = contextlib.redirect_stdout(self.devnull)
+        self.redirect.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.redirect.__exit__(*exc)
+        self.devnull.close()
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        result = {
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'rows': self.rows,
+            'rows_per_second': self.rows / wall if wall else None,
+            'peak_rss_mb': _peak_rss_mb(),
+            'peak_traced_mb': None,
+        }
+        if self.trace_memory:
+            result['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+        self.results[self.name] = result
+        print("{:<12}{:>10.2f}{:>10.2f}{:>12.0f}{:>14.1f}".format(
+            self.name, wall, cpu, result['rows_per_second'] or 0, result['peak_rss_mb']
+        ))
+
+
+def run(rows, catalog_size, keys, workers, seed, trace_memory, work_dir):
+    print("生成模拟数据: 商品目录{}条, 采购/销售各{}行, {}种商品描述...".format(catalog_size, rows, keys))
+    start = time.perf_counter()
+    catalog = generate_catalog(catalog_size, seed)
+    purchase_files, sales_files = generate_workbooks(os.path.join(work_dir, 'data'), catalog, rows, keys,
+                                                     seed=seed)
+    print("生成完成, 用时{:.1f}秒\n".format(time.perf_counter() - start))
+
+    stages = {}
+    print("{:<12}{:>10}{:>10}{:>12}{:>14}".format("阶段", "墙钟(秒)", "CPU(秒)", "行/秒", "峰值RSS(MB)"))
+
+    with Stage(stages, 'ingest', 2 * rows, trace_memory):
+        purchases = utils._parse_sheets([(y, m, SourceFile(p)) for y, m, p in purchase_files], Purchase, workers)
+        sales = utils._parse_sheets([(y, m, SourceFile(p)) for y, m, p in sales_files], Sales, workers)
+        purchases = [item for items in purchases for item in items]
+        sales = [item for items in sales for item in items]
+
+    with Stage(stages, 'preprocess', 2 * rows, trace_memory):
+        for item in purchases + sales:
+            item.normalize_product_info()
+            item.validate_data()
+
+    with Stage(stages, 'match', 2 * rows, trace_memory):
+        matcher = Matcher(catalog, cache_file=None)
+        matcher.match_all(purchases, workers=workers)
+        matcher.match_all(sales, workers=workers)
+    matched = sum(1 for item in purchases + sales if item.has_serial())
+
+    out_dir = os.path.join(work_dir, 'output')
+    utils.PURCHASE_OUT_DIR = os.path.join(out_dir, '采购导入')
+    utils.SALES_OUT_DIR = os.path.join(out_dir, '销售导入')
+    exported = [item for item in purchases if item.has_serial()], [item for item in sales if item.has_serial()]
+    with Stage(stages, 'export', len(exported[0]) + len(exported[1]), trace_memory):
+        utils.clear_output_dirs()
+        utils.batch_purchases(exported[0], workers=workers)
+        utils.group_sales(exported[1], workers=workers)
+
+    return {
+        'config': {
+            'rows': rows,
+            'catalog': catalog_size,
+            'keys': keys,
+            'workers': workers,
+            'seed': seed,
+            'trace_memory': trace_memory,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+        },
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'matched_rows': matched,
+        'match_counters': dict(matcher.counters()),
+        'stages': stages,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='采购/销售数据处理流程性能测试')
+    parser.add_argument('--rows', type=int, default=10000, help='采购、销售各生成的行数')
+    parser.add_argument('--catalog', type=int, default=20000, help='商品目录条数')
+    parser.add_argument('--keys', type=int, default=None, help='不同商品描述数, 默认 rows/5, 最多 5000')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true', help='用 tracemalloc 统计各阶段 Python 对象峰值(较慢)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--keep', action='store_true', help='保留生成的工作簿和导出文件')
+    args = parser.parse_args(argv)
+    keys = args.keys or max(1, min(args.rows // 5, 5000))
+
+    work_dir = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        result = run(args.rows, args.catalog, keys, args.workers, args.seed, args.trace_memory, work_dir)
+    finally:
+        if args.keep:
+            print("\n模拟数据保留在{}".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print("\n结果已写入{}".format(args.output))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+# 生成模拟的商品目录和采购/销售工作簿, 供 benchmarks.suite 使用
+# 商品描述由常见的药品名称、规格和生产企业组合而成, 采购/销售数据中的描述
+# 按一定比例加入笔误(缺字、多字、简写公司名、改写规格), 另有少量目录中不存在的商品
+import os
+import random
+
+from openpyxl import Workbook
+
+from models import Product
+
+NAME_ROOTS = [
+    '阿莫西林', '头孢克洛', '头孢呋辛', '阿奇霉素', '罗红霉素', '左氧氟沙星', '甲硝唑', '布洛芬',
+    '对乙酰氨基酚', '氨酚黄那敏', '银杏蜜环', '板蓝根', '双黄连', '藿香正气', '六味地黄', '复方丹参',
+    '硝苯地平', '氨氯地平', '二甲双胍', '格列齐特', '阿托伐他汀', '辛伐他汀', '奥美拉唑', '雷尼替丁',
+    '蒙脱石', '维生素C', '维生素B6', '葡萄糖酸钙', '氯化钠', '葡萄糖', '香丹', '曲克芦丁',
+    '泛影葡胺', '利巴韦林', '更昔洛韦', '地塞米松', '氢化可的松', '红霉素', '莫匹罗星', '小柴胡',
+]
+NAME_PREFIXES = ['', '', '', '复方', '小儿', '注射用', '盐酸', '精制']
+NAME_FORMS = ['片', '胶囊', '颗粒', '注射液', '口服溶液', '软膏', '滴眼液', '缓释片', '分散片', '糖浆']
+CITIES = ['成都', '重庆', '上海', '北京', '广州', '哈尔滨', '长春', '石家庄', '杭州', '西安', '昆明', '天津']
+BRANDS = ['天银', '华科', '天台山', '恒瑞', '康弘', '科伦', '太极', '同仁堂', '白云山', '扬子江',
+          '齐鲁', '辰欣', '华润', '三九', '天诚', '长征', '金环', '国森', '天辰', '新世纪']
+MANUFACTURER_SUFFIXES = ['制药有限公司', '药业有限公司', '药业股份有限公司', '制药厂', '生物制药有限公司']
+
+PURCHASE_HEADERS = ['供货商', '品名', '规格', '生产企业', '单位', '数量', '购进单价', '购进含税金额']
+SALES_HEADERS = ['出库日期', '商品去向', '品名', '规格', '生产企业', '单位', '数量', '含税单价', '含税金额']
+
+
+def random_name(rng):
+    return rng.choice(NAME_PREFIXES) + rng.choice(NAME_ROOTS) + rng.choice(NAME_FORMS)
+
+
+def random_dose(rng):
+    pattern = rng.randrange(4)
+    if pattern == 0:
+        return '{}mg*{}片'.format(rng.choice([5, 10, 25, 50, 100, 250, 500]), rng.choice([12, 24, 36, 48]))
+    if pattern == 1:
+        return '{}ml*{}支'.format(rng.choice([1, 2, 5, 10, 20]), rng.choice([5, 6, 10]))
+    if pattern == 2:
+        return '{}g*{}袋'.format(rng.choice([0.125, 0.25, 0.5, 1, 3, 5, 10]), rng.choice([6, 9, 10, 12]))
+    return '{}粒'.format(rng.choice([10, 12, 20, 24, 30]))
+
+
+def random_manufacturer(rng):
+    return rng.choice(CITIES) + rng.choice(BRANDS) + rng.choice(MANUFACTURER_SUFFIXES)
+
+
+def add_typo(rng, text):
+    if not text:
+        return text
+    kind = rng.randrange(5)
+    i = rng.randrange(len(text))
+    if kind == 0 and len(text) > 2:
+        return text[:i] + text[i + 1:]
+    if kind == 1:
+        return text[:i] + text[i] + text[i:]
+    if kind == 2 and '有限公司' in text:
+        return text.replace('有限公司', '公司')
+    if kind == 3 and '*' in text:
+        return text.replace('*', 'x')
+    return text[:i] + ' ' + text[i:]
+
+
+def generate_catalog(size, seed=0):
+    rng = random.Random(seed)
+    products, seen = [], set()
+    while len(products) < size:
+        fields = random_name(rng), random_dose(rng), random_manufacturer(rng)
+        if fields in seen:
+            continue
+        seen.add(fields)
+        name, dose, manufacturer = fields
+        products.append(Product(serial='{:07d}'.format(100000 + len(products)),
+                                name=name, dose=dose, manufacturer=manufacturer))
+    return products
+
+
+def generate_descriptions(catalog, keys, seed=0, typo_rate=0.3, unknown_rate=0.05):
+    # 采购/销售数据中出现的不同商品描述
+    rng = random.Random(seed + 1)
+    descriptions = []
+    for product in rng.sample(catalog, min(keys, len(catalog))):
+        if rng.random() < unknown_rate:
+            descriptions.append((random_name(rng), random_dose(rng), random_manufacturer(rng)))
+            continue
+        fields = [product.name, product.dose, product.manufacturer]
+        if rng.random() < typo_rate:
+            i = rng.randrange(3)
+            fields[i] = add_typo(rng, fields[i])
+        descriptions.append(tuple(fields))
+    return descriptions
+
+
+def _write_book(path, headers, rows):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    book.save(path)
+
+
+def generate_workbooks(root, catalog, rows, keys, year=2017, months=12, seed=0):
+    # 采购、销售各 rows 行, 平均分布在 months 个月的工作簿中; 描述按长尾分布抽取.
+    # 返回 (年, 月, 文件路径) 列表: (采购文件, 销售文件)
+    rng = random.Random(seed + 2)
+    descriptions = generate_descriptions(catalog, keys, seed)
+    weights = [1.0 / (i + 1) for i in range(len(descriptions))]
+    vendors = ['{}{}医药有限公司'.format(c, b) for c in CITIES for b in BRANDS][:200]
+    clients = ['{}{}{}大药房'.format(c, b, n) for c in CITIES for b in BRANDS for n in ('', '连锁')]
+
+    purchase_files, sales_files = [], []
+    per_month = [rows // months + (1 if m < rows % months else 0) for m in range(months)]
+    for m, count in enumerate(per_month, start=1):
+        picks = rng.choices(descriptions, weights=weights, k=count)
+        purchase_rows, sales_rows = [], []
+        for name, dose, manufacturer in picks:
+            amount = float(rng.randrange(1, 500))
+            price = round(rng.uniform(1, 200), 2)
+            purchase_rows.append([rng.choice(vendors), name, dose, manufacturer, '盒',
+                                  amount, price, round(amount * price, 2)])
+            sale_price = round(price * rng.uniform(1.05, 1.3), 2)
+            sales_rows.append(['{}月'.format(m), rng.choice(clients), name, dose, manufacturer, '盒',
+                               amount, sale_price, round(amount * sale_price, 2)])
+        path = os.path.join(root, str(year), '购进', '购进明细{}年{}月.xlsx'.format(year, m))
+        _write_book(path, PURCHASE_HEADERS, purchase_rows)
+        purchase_files.append((str(year), str(m), path))
+        path = os.path.join(root, str(year), '销售', '销售明细{}年{}月.xlsx'.format(year, m))
+        _write_book(path, SALES_HEADERS, sales_rows)
+        sales_files.append((str(year), str(m), path))
+    return purchase_files, sales_files
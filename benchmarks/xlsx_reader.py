@@ -0,0 +1,58 @@
+# 对比 xlrd 与流式读取 .xlsx 源文件的解析时间和峰值内存(RSS)
+# 用法(在项目根目录): python -m benchmarks.xlsx_reader [年份]
+# 每种读取方式在单独的子进程中运行, 峰值 RSS 互不影响
+import contextlib
+import io
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import readers
+from models import Purchase, Sales
+from utils import preprocess_sheets
+from settings import *
+
+
+def parse_year(backend, year):
+    readers.XLSX_READER = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        purchase_sheets, sales_sheets = preprocess_sheets()
+    jobs = [(sheet, Purchase) for y, m, sheet in purchase_sheets if y == year]
+    jobs += [(sheet, Sales) for y, m, sheet in sales_sheets if y == year]
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    rows = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for sheet, model_class in jobs:
+            for _ in sheet.extract_data(model_class):
+                rows += 1
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {'files': len(jobs), 'rows': rows, 'seconds': elapsed, 'peak_rss_mb': peak,
+            'parse_rss_mb': peak - baseline}
+
+
+def main(year):
+    print("{}年数据".format(year))
+    print("{:<14}{:>6}{:>10}{:>12}{:>16}{:>16}".format(
+        "方式", "文件", "行数", "用时(秒)", "峰值RSS(MB)", "解析增长(MB)"))
+    for backend in ('xlrd', 'stream'):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.xlsx_reader', '--child', backend, year],
+            stdout=subprocess.PIPE, check=True
+        ).stdout
+        result = json.loads(output.decode().splitlines()[-1])
+        print("{:<14}{:>6}{:>10}{:>12.2f}{:>16.1f}{:>16.1f}".format(
+            backend, result['files'], result['rows'], result['seconds'],
+            result['peak_rss_mb'], result['parse_rss_mb']
+        ))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print(json.dumps(parse_year(sys.argv[2], sys.argv[3])))
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else '2017')
@@ -0,0 +1,226 @@
+import heapq
+import json
+import math
+import os
+import shutil
+from collections import defaultdict
+
+import numpy as np
+
+from columnar import replace_directory
+from models import Product
+from settings import *
+
+GRAM_SIZES = (2, 3)
+CATALOG_VERSION = 3
+
+
+def string_grams(value, sizes=GRAM_SIZES):
+    value = str(value)
+    if 0 < len(value) < min(sizes):
+        return {value}
+    grams = set()
+    for size in sizes:
+        for i in range(len(value) - size + 1):
+            grams.add(value[i:i + size])
+    return grams
+
+
+def product_grams(item):
+    grams = set()
+    for field in (item.name, item.dose, item.manufacturer):
+        if field is not None:
+            grams |= string_grams(field)
+    return grams
+
+
+# 精确索引: 规范化后的(品名, 规格, 生产企业)完全一致时直接给出编码;
+# 其次按(品名, 生产企业)查找, 仅在该组合对应唯一编码时采用.
+class ExactIndex:
+
+    def __init__(self, products):
+        self.by_key = {}
+        by_pair = defaultdict(list)
+        for product in products:
+            key = product.product_key
+            self.by_key.setdefault(key, product)
+            by_pair[key[0], key[2]].append(product)
+        self.by_pair = {}
+        for pair, candidates in by_pair.items():
+            if len({product.serial for product in candidates}) == 1:
+                self.by_pair[pair] = candidates[0]
+
+    def lookup(self, item):
+        key = item.product_key
+        product = self.by_key.get(key)
+        if product is not None:
+            return product, MATCH_EXACT
+        product = self.by_pair.get((key[0], key[2]))
+        if product is not None:
+            return product, MATCH_NAME_MANUFACTURER
+        return None, None
+
+
+# 倒排索引: 商品目录中品名/规格/生产企业的字符二元/三元组 -> 商品位置.
+# 每条待匹配数据只需与得分最高的少量候选商品做完整比较.
+class CatalogIndex:
+
+    def __init__(self, products, limit=SHORTLIST_SIZE, max_df=INDEX_MAX_DF, grams=None):
+        # grams: 编译后商品目录中预先计算的 (片段表, indptr, indices), 省去逐个商品切分片段
+        self.products = products
+        self.limit = limit
+        if grams is None:
+            postings = defaultdict(list)
+            for position, product in enumerate(products):
+                for gram in product_grams(product):
+                    postings[gram].append(position)
+        else:
+            postings = invert_grams(*grams)
+
+        # 过于常见的片段(如"有限公司")对排序几乎没有区分度, 直接舍弃
+        cutoff = max(1, int(len(products) * max_df))
+        total = len(products)
+        self.postings, self.weights = {}, {}
+        for gram, positions in postings.items():
+            if len(positions) > cutoff:
+                continue
+            self.postings[gram] = positions
+            self.weights[gram] = math.log(total / len(positions)) + 1
+
+        self.queries = 0
+        self.comparisons = 0
+
+    def rank(self, item, limit=None):
+        limit = self.limit if limit is None else limit
+        # 片段按固定顺序累加, 得分相同时位置靠前的商品优先, 候选与 PYTHONHASHSEED 无关
+        scores = defaultdict(float)
+        for gram in sorted(product_grams(item)):
+            positions = self.postings.get(gram)
+            if positions is None:
+                continue
+            weight = self.weights[gram]
+            for position in positions:
+                scores[position] += weight
+        return heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+
+    def shortlist(self, item, limit=None):
+        # 候选按目录原顺序返回, 保证与在这些商品上做全量扫描得到同样的编码
+        positions = sorted(position for position, _ in self.rank(item, limit))
+        self.queries += 1
+        self.comparisons += len(positions)
+        return [self.products[position] for position in positions]
+
+    @property
+    def avoided(self):
+        return self.queries * len(self.products) - self.comparisons
+
+    def report(self):
+        if not self.queries:
+            return
+        print("候选筛选: 共{}条数据, 完整比较{}次, 避免{}次 ({:.1f}%)\n".format(
+            self.queries,
+            self.comparisons,
+            self.avoided,
+            100 * self.avoided / (self.queries * len(self.products))
+        ))
+
+
+def invert_grams(vocabulary, indptr, indices):
+    # 商品 -> 片段(CSR) 转为 片段 -> 商品位置列表, 位置按目录顺序排列
+    docs = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    positions = docs[order].tolist()
+    counts = np.bincount(indices, minlength=len(vocabulary))
+    ends = np.cumsum(counts).tolist()
+    postings, start = {}, 0
+    for gram, end in zip(vocabulary, ends):
+        if end > start:
+            postings[gram] = positions[start:end]
+        start = end
+    return postings
+
+
+# ==============编译后的商品目录================
+# 由 index_new.xls 生成的目录文件夹: 商品字段(已规范化)、拼接后的商品描述(相似度比较用的 info)
+# 和倒排索引用的各商品字符片段集合. 数组以 .npy 保存, 读取时内存映射, 多个进程共享同一份页缓存;
+# 源文件指纹变化时重新生成.
+
+PRODUCT_FIELDS = ['serial', 'name', 'dose', 'manufacturer']
+
+
+def compile_catalog(products, path, source):
+    temp_path = path + '.tmp'
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    rows = [[getattr(product, field) for field in PRODUCT_FIELDS] for product in products]
+    info = [product.similarity_fields()['info'] for product in products]
+    with open(os.path.join(temp_path, 'products.json'), 'w', encoding='utf-8') as f:
+        json.dump({'fields': PRODUCT_FIELDS, 'rows': rows, 'info': info}, f, ensure_ascii=False)
+
+    vocabulary, indptr, indices = {}, [0], []
+    for product in products:
+        indices.extend(vocabulary.setdefault(gram, len(vocabulary)) for gram in product_grams(product))
+        indptr.append(len(indices))
+    with open(os.path.join(temp_path, 'grams.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(vocabulary), f, ensure_ascii=False)
+    np.save(os.path.join(temp_path, 'grams.indptr.npy'), np.array(indptr, dtype=np.int64))
+    np.save(os.path.join(temp_path, 'grams.indices.npy'), np.array(indices, dtype=np.int32))
+
+    meta = {'version': CATALOG_VERSION, 'source': source, 'products': len(products), 'gram_sizes': GRAM_SIZES}
+    with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    replace_directory(temp_path, path)
+
+
+class CompiledCatalog:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._products = None
+        self._grams = None
+
+    @property
+    def source(self):
+        return self.meta['source']
+
+    def __len__(self):
+        return self.meta['products']
+
+    def products(self):
+        if self._products is None:
+            with open(os.path.join(self.path, 'products.json'), encoding='utf-8') as f:
+                data = json.load(f)
+            products = []
+            for row, info in zip(data['rows'], data['info']):
+                product = Product.__new__(Product)
+                product._set_defaults()
+                for field, value in zip(data['fields'], row):
+                    setattr(product, field, value)
+                product.errors = {}
+                product.set_info(info)
+                products.append(product)
+            self._products = products
+        return self._products
+
+    def grams(self):
+        if self._grams is None:
+            with open(os.path.join(self.path, 'grams.json'), encoding='utf-8') as f:
+                vocabulary = json.load(f)
+            self._grams = (
+                vocabulary,
+                np.load(os.path.join(self.path, 'grams.indptr.npy'), mmap_mode='r'),
+                np.load(os.path.join(self.path, 'grams.indices.npy'), mmap_mode='r'),
+            )
+        return self._grams
+
+
+def load_compiled_catalog(path):
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    catalog = CompiledCatalog(path)
+    if catalog.meta.get('version') != CATALOG_VERSION or tuple(catalog.meta['gram_sizes']) != GRAM_SIZES:
+        return None
+    return catalog
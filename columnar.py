@@ -0,0 +1,258 @@
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+from models import Product, Purchase, Sales
+from settings import *
+
+MODELS = {'Purchase': Purchase, 'Sales': Sales}
+OPS_MODELS = {PURCHASE_FILE: Purchase, SALES_FILE: Sales}
+
+INT_FIELDS = ['year', 'month', 'row']
+FLOAT_FIELDS = ['amount', 'unit_price', '_price', 'total_price', 'match_score', 'difflib_score']
+BOOL_FIELDS = ['scanned', 'unlikely']
+CANDIDATE_FIELDS = ['serial', 'name', 'dose', 'manufacturer']
+
+
+def columns_path(data_file):
+    return data_file + COLUMNS_SUFFIX
+
+
+def model_fields(model_class):
+    kinds = {}
+    for field in list(model_class.KEY_HEADERS.values()) + ['serial', 'match_type', 'source']:
+        kinds[field] = 'float' if field in FLOAT_FIELDS else 'str'
+    for field in INT_FIELDS:
+        kinds[field] = 'int'
+    for field in ['match_score', 'difflib_score']:
+        kinds[field] = 'float'
+    for field in BOOL_FIELDS:
+        kinds[field] = 'bool'
+    return kinds
+
+
+# ==============写入================
+
+def _encode_strings(values):
+    table, codes = {}, np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        codes[i] = table.setdefault(str(value), len(table))
+    return list(table), codes
+
+
+def _encode_values(values):
+    # 原样保存的取值表: 按(类型, 值)去重, json 可以还原 str/int/float, None 编码为 -1
+    table, codes = {}, np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        if value is None:
+            codes[i] = -1
+            continue
+        codes[i] = table.setdefault((type(value), value), len(table))
+    return [value for _, value in table], codes
+
+
+def _encode_numbers(values, dtype):
+    array = np.empty(len(values), dtype=dtype)
+    missing = -1 if dtype == np.int32 else np.nan
+    for i, value in enumerate(values):
+        try:
+            array[i] = int(value) if dtype == np.int32 else float(value)
+        except (TypeError, ValueError):
+            array[i] = missing
+    return array
+
+
+def _write_strings(path, name, values):
+    table, codes = _encode_strings(values)
+    np.save(os.path.join(path, name + '.codes.npy'), codes)
+    with open(os.path.join(path, name + '.strings.json'), 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False)
+
+
+def save_columns(items, path, model_class):
+    kinds = model_fields(model_class)
+    temp_path = path + '.tmp'
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+
+    for field, kind in kinds.items():
+        values = [getattr(item, field, None) for item in items]
+        if kind == 'str':
+            _write_strings(temp_path, field, values)
+        elif kind == 'bool':
+            np.save(os.path.join(temp_path, field + '.npy'), np.array(values, dtype=bool))
+        else:
+            # 数值列供统计查询使用; 数据对象按原样保存的取值还原(源文件中的数值多为字符串, 如 '0.0')
+            array = _encode_numbers(values, np.int32 if kind == 'int' else np.float64)
+            np.save(os.path.join(temp_path, field + '.npy'), array)
+            table, codes = _encode_values(values)
+            np.save(os.path.join(temp_path, field + '.values.codes.npy'), codes)
+            with open(os.path.join(temp_path, field + '.values.strings.json'), 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False)
+
+    # 候选商品为不等长列表: offsets + 扁平化的商品字段
+    lengths = np.array([len(item.potential_matches) for item in items], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    np.save(os.path.join(temp_path, 'candidates.offsets.npy'), offsets)
+    candidates = [p for item in items for p in item.potential_matches]
+    for field in CANDIDATE_FIELDS:
+        values = [None if p is None else getattr(p, field) for p in candidates]
+        _write_strings(temp_path, 'candidates.' + field, values)
+    # 候选得分与候选商品一一对应; 旧数据没有得分时整列为空
+    scores = [score for item in items for score in item.potential_scores]
+    if len(scores) != len(candidates):
+        scores = []
+    np.save(os.path.join(temp_path, 'candidates.score.npy'), np.array(scores, dtype=np.float64))
+
+    meta = {
+        'model': model_class.__name__,
+        'rows': len(items),
+        'fields': kinds,
+    }
+    with open(os.path.join(temp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    replace_directory(temp_path, path)
+
+
+def replace_directory(temp_path, path):
+    # 新目录完整写出后再替换旧目录
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(temp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+# ==============读取================
+
+# 按列惰性读取: 数值列以内存映射方式打开, 字符串列读取编码和字符串表
+class ColumnStore:
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.model_class = MODELS[self.meta['model']]
+        self.kinds = self.meta['fields']
+        self._cache = {}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def _load(self, name):
+        if name not in self._cache:
+            file_path = os.path.join(self.path, name + '.npy')
+            self._cache[name] = np.load(file_path, mmap_mode='r')
+        return self._cache[name]
+
+    def _strings(self, name):
+        key = name + '.strings'
+        if key not in self._cache:
+            with open(os.path.join(self.path, key + '.json'), encoding='utf-8') as f:
+                self._cache[key] = json.load(f)
+        return self._load(name + '.codes'), self._cache[key]
+
+    def codes(self, field):
+        return self._strings(field)[0]
+
+    def values(self, field):
+        # 数值列保存时的原始取值(与 pickle 存储一致)
+        codes, table = self._strings(field + '.values')
+        return [None if code < 0 else table[code] for code in codes]
+
+    def column(self, field):
+        kind = self.kinds[field]
+        if kind != 'str':
+            return self._load(field)
+        codes, table = self._strings(field)
+        return [None if code < 0 else table[code] for code in codes]
+
+    def candidate_counts(self):
+        return np.diff(self._load('candidates.offsets'))
+
+    def _candidates(self):
+        offsets = self._load('candidates.offsets')
+        columns = [self._strings('candidates.' + field) for field in CANDIDATE_FIELDS]
+        products = {}
+        result = []
+        for i in range(offsets[-1] if len(offsets) else 0):
+            codes = tuple(int(column[0][i]) for column in columns)
+            if codes[0] < 0:
+                result.append(None)
+                continue
+            if codes not in products:
+                fields = {f: column[1][code] for f, column, code in zip(CANDIDATE_FIELDS, columns, codes)
+                          if code >= 0}
+                products[codes] = Product(**fields)
+            result.append(products[codes])
+        return offsets, result
+
+    def _candidate_scores(self):
+        if not os.path.exists(os.path.join(self.path, 'candidates.score.npy')):
+            return []
+        return self._load('candidates.score').tolist()
+
+    def _legacy_numbers(self, field, kind):
+        # 旧版本只保存了数值列, 按数值还原, 无法解析的取值记录在 meta['raw'] 中
+        column = self.column(field).tolist()
+        if kind == 'int':
+            column = [None if v < 0 else str(v) for v in column]
+        else:
+            column = [None if v != v else v for v in column]
+        for i, value in self.meta.get('raw', {}).get(field, {}).items():
+            column[int(i)] = value
+        return column
+
+    def items(self):
+        values = {}
+        for field, kind in self.kinds.items():
+            if kind == 'str':
+                values[field] = self.column(field)
+            elif kind == 'bool':
+                values[field] = self.column(field).tolist()
+            elif os.path.exists(os.path.join(self.path, field + '.values.strings.json')):
+                values[field] = self.values(field)
+            else:
+                values[field] = self._legacy_numbers(field, kind)
+
+        offsets, candidates = self._candidates()
+        offsets = offsets.tolist()
+        scores = self._candidate_scores()
+        fields = list(self.kinds)
+        items = []
+        for i, row in enumerate(zip(*[values[field] for field in fields])):
+            item = self.model_class()
+            for field, value in zip(fields, row):
+                setattr(item, field, value)
+            item.errors = {}
+            item.potential_matches = candidates[offsets[i]:offsets[i + 1]]
+            item.potential_scores = scores[offsets[i]:offsets[i + 1]] if scores else []
+            items.append(item)
+        return items
+
+
+def load_columns(path):
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return None
+    return ColumnStore(path).items()
+
+
+def convert_pickles():
+    for data_file in (PURCHASE_FILE, SALES_FILE):
+        with open(data_file, 'rb') as fin:
+            items = pickle.load(fin)
+        print("转换{}: {}行 -> {}".format(data_file, len(items), columns_path(data_file)))
+        save_columns(items, columns_path(data_file), OPS_MODELS[data_file])
+    print("转换完成\n")
+
+
+if __name__ == '__main__':
+    convert_pickles()
@@ -0,0 +1,113 @@
+import json
+import os
+from collections import Counter
+
+from settings import *
+from utils import save_data
+
+
+def journal_path(data_file):
+    return data_file + JOURNAL_SUFFIX
+
+
+def row_key(item):
+    # 同一月份可能有多个文件, 行号需与来源文件一起才能唯一确定一行
+    return [item.source, item.year, item.month, item.row]
+
+
+def _unique_index(ops_list, key):
+    # 键相同的行无法区分, 不参与回放
+    keys = [key(item) for item in ops_list]
+    counts = Counter(keys)
+    return {k: item for k, item in zip(keys, ops_list) if counts[k] == 1}
+
+
+# 匹配日志: 每匹配完一行只追加一条记录(行标识, 编码, 候选编码),
+# 代替每 500 行重写一次完整的 pickle. 中断后通过 replay 恢复进度,
+# compact 把日志并入数据文件并清空.
+class MatchJournal:
+
+    def __init__(self, data_file, sync_every=JOURNAL_SYNC_EVERY):
+        self.data_file = data_file
+        self.path = journal_path(data_file)
+        self.sync_every = sync_every
+        self.pending = 0
+        self.records = 0
+        self._recover()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def _recover(self):
+        # 崩溃时最后一行可能只写了一半, 截断到最后一个完整的换行处
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+            self.records = data.count(b'\n', 0, end)
+
+    def record(self, item):
+        entry = {
+            'key': row_key(item),
+            'serial': item.serial,
+            'scanned': item.scanned,
+            'unlikely': item.unlikely,
+            'match_type': item.match_type,
+            'candidates': [None if p is None else p.serial for p in item.potential_matches],
+            'scores': item.potential_scores,
+        }
+        self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.records += 1
+        self.pending += 1
+        if self.pending >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def entries(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def replay(self, ops_list, products):
+        by_key = _unique_index(ops_list, lambda item: tuple(row_key(item)))
+        # 旧版本日志的键为(年, 月, 行), 只在其唯一时对应
+        by_legacy_key = _unique_index(ops_list, lambda item: tuple(row_key(item)[1:]))
+        by_serial = {}
+        for product in products:
+            by_serial.setdefault(product.serial, product)
+
+        replayed = set()
+        for entry in self.entries():
+            key = tuple(entry['key'])
+            item = by_key.get(key) if len(key) == 4 else by_legacy_key.get(key)
+            if item is None:
+                continue
+            item.serial = entry['serial']
+            item.scanned = entry['scanned']
+            item.unlikely = entry['unlikely']
+            item.match_type = entry['match_type']
+            item.potential_matches = [by_serial.get(s) for s in entry['candidates']]
+            item.potential_scores = entry.get('scores', [])
+            replayed.add(id(item))
+        if replayed:
+            print("从匹配日志{}中恢复{}行匹配结果\n".format(self.path, len(replayed)))
+        return replayed
+
+    def compact(self, ops_list):
+        # save_data 先完整写出新的数据文件再替换, 替换前崩溃时日志仍然有效
+        self.sync()
+        save_data(ops_list, self.data_file)
+        self.file.close()
+        self.file = open(self.path, 'w', encoding='utf-8')
+        self.records = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+        if not self.records:
+            os.remove(self.path)
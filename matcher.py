@@ -0,0 +1,314 @@
+import hashlib
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import CatalogIndex, CompiledCatalog, ExactIndex
+from models import MATCH_COUNTERS
+from settings import *
+from similarity import SIMILARITY_CALLS
+from tfidf import TfidfScorer, report_scores
+from utils import save_data, load_data
+
+# 匹配结果(outcome)的格式版本, 格式变化后旧的匹配缓存自动失效
+OUTCOME_VERSION = 3
+
+
+def match_item(item, products, thresholds=MATCH_THRESHOLDS, kernel=SIMILARITY_KERNEL):
+    item.clear_suggestions()
+
+    best_match, best_similarity = None, 0
+    for product in products:
+        # 已有候选时, 低于候选阈值的结果不再影响输出
+        best = best_similarity if not item.potential_matches else 1.0
+        result = item.match_product(product, thresholds, best, kernel)
+        if item.has_serial():
+            break
+        if result is not None and result > best_similarity:
+            best_similarity = result
+            best_match = product
+    if not len(item.potential_matches):
+        item.add_suggestion(best_match, best_similarity)
+
+
+def catalog_fingerprint(products):
+    digest = hashlib.sha1()
+    for product in products:
+        digest.update("{}\t{}\t{}\t{}\n".format(
+            product.serial, product.name, product.dose, product.manufacturer
+        ).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def group_by_key(items):
+    groups = OrderedDict()
+    for item in items:
+        groups.setdefault(item.product_key, []).append(item)
+    return groups
+
+
+class Matcher:
+
+    def __init__(self, products, use_index=True, use_exact=True, scorer='difflib',
+                 thresholds=None, cache_file=MATCH_CACHE_FILE, catalog=None, kernel=SIMILARITY_KERNEL):
+        # catalog: 编译后的商品目录(CompiledCatalog), 给出时索引直接使用其中的片段特征,
+        # 子进程也从目录文件读取商品, 不再经进程间传递
+        self.products = products
+        self.catalog = catalog
+        self.positions = {id(product): i for i, product in enumerate(products)}
+        grams = catalog.grams() if catalog is not None else None
+        self.index = CatalogIndex(products, grams=grams) if use_index else None
+        self.exact = ExactIndex(products) if use_exact else None
+        self.scorer = scorer
+        self.kernel = kernel
+        self.tfidf = TfidfScorer(products) if scorer == 'tfidf' else None
+        if thresholds is None:
+            thresholds = TFIDF_THRESHOLDS if scorer == 'tfidf' else MATCH_THRESHOLDS
+        self.thresholds = thresholds
+        self.stats = Counter()
+        self.cache_file = cache_file
+        self.results = self._load_cache()
+
+    @property
+    def options(self):
+        return {
+            'use_index': self.index is not None,
+            'use_exact': self.exact is not None,
+            'scorer': self.scorer,
+            'kernel': self.kernel,
+            'thresholds': self.thresholds,
+        }
+
+    @property
+    def signature(self):
+        options = dict(self.options, thresholds=sorted(self.thresholds.items()), outcome=OUTCOME_VERSION)
+        return catalog_fingerprint(self.products), sorted(options.items())
+
+    def _load_cache(self):
+        if self.cache_file is None:
+            return {}
+        cache = load_data(self.cache_file)
+        if not cache or cache['signature'] != self.signature:
+            return {}
+        print("从匹配缓存中载入{}组已匹配的商品描述\n".format(len(cache['results'])))
+        return cache['results']
+
+    def save_cache(self):
+        if self.cache_file is None:
+            return
+        save_data({'signature': self.signature, 'results': self.results}, self.cache_file)
+
+    def candidates(self, item):
+        if self.index is None:
+            return self.products
+        return self.index.shortlist(item)
+
+    def match_exact(self, item):
+        if self.exact is None:
+            return False
+        product, match_type = self.exact.lookup(item)
+        if product is None:
+            return False
+        item.serial = product.serial
+        item.scanned = True
+        item.clear_suggestions()
+        item.match_type = match_type
+        self.stats[match_type] += 1
+        return True
+
+    def match(self, item):
+        if self.match_exact(item):
+            return
+        match_item(item, self.candidates(item), self.thresholds, self.kernel)
+        self._count_fuzzy(item)
+
+    def _count_fuzzy(self, item):
+        if item.has_serial():
+            item.match_type = MATCH_FUZZY
+            self.stats[MATCH_FUZZY] += 1
+        else:
+            self.stats['unmatched'] += 1
+
+    def match_batch(self, items):
+        # TF-IDF 模式: 精确命中之外的数据整批向量化打分
+        fuzzy = [item for item in items if not self.match_exact(item)]
+        for item, candidates in self.tfidf.top_candidates(fuzzy):
+            self.tfidf.decide(item, candidates, self.thresholds)
+            self._count_fuzzy(item)
+        report_scores(fuzzy)
+
+    def outcome(self, item):
+        matches = [None if p is None else self.positions[id(p)] for p in item.potential_matches]
+        scores = item.match_score, item.difflib_score
+        return (item.serial, item.scanned, item.unlikely, item.match_type,
+                matches, list(item.potential_scores), scores)
+
+    def apply(self, item, outcome):
+        item.serial, item.scanned, item.unlikely, item.match_type, matches, suggestion_scores, scores = outcome
+        item.potential_matches = [None if p is None else self.products[p] for p in matches]
+        item.potential_scores = list(suggestion_scores)
+        item.match_score, item.difflib_score = scores
+
+    def match_all(self, items, workers=MATCH_WORKERS, on_progress=None, on_item=None, executor=None):
+        # 相同商品描述只匹配一次, 结果分发给组内所有数据; 已缓存的描述直接复用.
+        # executor: 由 start_pool 创建的进程池, 多次调用时复用同一批子进程
+        groups = group_by_key(items)
+        self.stats['rows'] += len(items)
+        self.stats['keys'] += len(groups)
+        done = 0
+
+        def resolve(key, outcome):
+            nonlocal done
+            for item in groups[key]:
+                self.apply(item, outcome)
+                if on_item is not None:
+                    on_item(item)
+            done += len(groups[key])
+
+        pending = []
+        for key, group in groups.items():
+            if key in self.results:
+                self.stats['cached'] += 1
+                resolve(key, self.results[key])
+            else:
+                pending.append(group[0])
+        if done and on_progress is not None:
+            on_progress(done)
+
+        if self.tfidf is not None:
+            self.match_batch(pending)
+            for item in pending:
+                self.results[item.product_key] = self.outcome(item)
+                resolve(item.product_key, self.results[item.product_key])
+            if on_progress is not None:
+                on_progress(done)
+            return
+
+        if workers > 1 or executor is not None:
+            for chunk in match_items_parallel(pending, self, workers=workers, executor=executor):
+                for item in chunk:
+                    self.results[item.product_key] = self.outcome(item)
+                    resolve(item.product_key, self.results[item.product_key])
+                if on_progress is not None:
+                    on_progress(done)
+            return
+
+        for item in pending:
+            self.match(item)
+            self.results[item.product_key] = self.outcome(item)
+            resolve(item.product_key, self.results[item.product_key])
+            if on_progress is not None:
+                on_progress(done)
+
+    def counters(self):
+        counters = Counter(self.stats)
+        for key, value in MATCH_COUNTERS.items():
+            counters['cascade_' + key] = value
+        for key, value in SIMILARITY_CALLS.items():
+            counters['calls_' + key] = value
+        if self.index is not None:
+            counters['queries'] = self.index.queries
+            counters['comparisons'] = self.index.comparisons
+        return counters
+
+    def merge(self, counters):
+        for key, value in counters.items():
+            if key == 'queries' and self.index is not None:
+                self.index.queries += value
+            elif key == 'comparisons' and self.index is not None:
+                self.index.comparisons += value
+            elif key.startswith('cascade_'):
+                MATCH_COUNTERS[key[len('cascade_'):]] += value
+            elif key.startswith('calls_'):
+                SIMILARITY_CALLS[key[len('calls_'):]] += value
+            else:
+                self.stats[key] += value
+
+    def report(self):
+        print("去重: {}行数据共{}组不同商品描述, 其中{}组来自缓存".format(
+            self.stats['rows'],
+            self.stats['keys'],
+            self.stats['cached']
+        ))
+        print("精确命中: {}\t\t品名+厂家命中: {}\t\t模糊命中: {}\t\t未匹配: {}\n".format(
+            self.stats[MATCH_EXACT],
+            self.stats[MATCH_NAME_MANUFACTURER],
+            self.stats[MATCH_FUZZY],
+            self.stats['unmatched']
+        ))
+        if MATCH_COUNTERS['candidates']:
+            print("逐级淘汰: 共比较{}个候选, 长度上界淘汰{}, quick_ratio淘汰{}, 完整ratio淘汰{}".format(
+                MATCH_COUNTERS['candidates'],
+                MATCH_COUNTERS['length'],
+                MATCH_COUNTERS['quick'],
+                MATCH_COUNTERS['ratio']
+            ))
+            print("相似度计算: SequenceMatcher.ratio {}次, quick_ratio {}次, Indel {}次\n".format(
+                SIMILARITY_CALLS['difflib_ratio'],
+                SIMILARITY_CALLS['difflib_quick_ratio'],
+                SIMILARITY_CALLS['indel_ratio']
+            ))
+        if self.index is not None:
+            self.index.report()
+
+
+# ==============多进程匹配================
+# 商品目录(及索引)通过 initializer 在每个子进程中只传递/构建一次(有编译目录时只传路径),
+# 任务只携带待匹配数据, 结果以商品在目录中的位置传回主进程.
+
+_worker = {}
+
+
+def _init_worker(products, options, catalog_path=None):
+    catalog = None
+    if catalog_path is not None:
+        catalog = CompiledCatalog(catalog_path)
+        products = catalog.products()
+    _worker['matcher'] = Matcher(products, cache_file=None, catalog=catalog, **options)
+
+
+def _match_chunk(items):
+    matcher = _worker['matcher']
+    before = matcher.counters()
+    outcomes = []
+    for item in items:
+        matcher.match(item)
+        outcomes.append(matcher.outcome(item))
+    counters = matcher.counters()
+    counters.subtract(before)
+    return outcomes, counters
+
+
+def _initargs(matcher):
+    if matcher.catalog is not None:
+        return None, matcher.options, matcher.catalog.path
+    return matcher.products, matcher.options
+
+
+def start_pool(matcher, workers=MATCH_WORKERS):
+    # 供多次匹配共用的进程池: 子进程在返回前即已全部启动并载入商品目录,
+    # 调用方可以在启动其它线程之前创建, 避免在多线程运行时 fork
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=_initargs(matcher))
+    executor.submit(len, ()).result()
+    return executor
+
+
+def match_items_parallel(items, matcher, workers=MATCH_WORKERS, chunk_size=MATCH_CHUNK_SIZE, executor=None):
+    for item in items:
+        item.clear_suggestions()
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if not chunks:
+        return
+
+    if executor is not None:
+        yield from _apply_chunks(chunks, executor, matcher)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=_initargs(matcher)) as executor:
+        yield from _apply_chunks(chunks, executor, matcher)
+
+
+def _apply_chunks(chunks, executor, matcher):
+    for chunk, (outcomes, counters) in zip(chunks, executor.map(_match_chunk, chunks)):
+        for item, outcome in zip(chunk, outcomes):
+            matcher.apply(item, outcome)
+        matcher.merge(counters)
+        yield chunk
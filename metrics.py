@@ -0,0 +1,94 @@
+import json
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from settings import *
+from similarity import SIMILARITY_CALLS
+
+
+# 运行指标: 各阶段和各源文件的墙钟/CPU 用时、处理行数, 以及匹配计数器
+# (各算法的相似度计算次数、缓存命中等). 运行结束时写入 METRICS_FILE.
+# 相似度计算次数取自 SIMILARITY_CALLS 自 reset 以来的增量, 包括匹配之后生成整理建议时的计算
+class Metrics:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.stages = OrderedDict()
+        self.files = []
+        self.counters = Counter()
+        self.similarity_start = Counter(SIMILARITY_CALLS)
+
+    @contextmanager
+    def stage(self, name, rows=0):
+        # 同名阶段多次运行时累加; 行数可在 with 块中通过 stage['rows'] 补充
+        current = {'rows': rows}
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield current
+        finally:
+            record = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'runs': 0})
+            record['wall_seconds'] += time.perf_counter() - wall
+            record['cpu_seconds'] += time.process_time() - cpu
+            record['rows'] += current['rows']
+            record['runs'] += 1
+
+    def record_file(self, file_name, rows, wall, cpu):
+        self.files.append({'file': file_name, 'rows': rows, 'wall_seconds': wall, 'cpu_seconds': cpu})
+
+    def count(self, key, value=1):
+        self.counters[key] += value
+
+    def record_matcher(self, matcher):
+        counters = matcher.counters()
+        self.counters['match_cache_hits'] += counters['cached']
+        self.counters['match_rows'] += counters['rows']
+        self.counters['match_keys'] += counters['keys']
+        for key in (MATCH_EXACT, MATCH_NAME_MANUFACTURER, MATCH_FUZZY, 'unmatched'):
+            self.counters['match_' + key] += counters[key]
+
+    def summary(self):
+        stages = OrderedDict()
+        for name, record in self.stages.items():
+            wall = record['wall_seconds']
+            stages[name] = dict(record, rows_per_second=record['rows'] / wall if wall and record['rows'] else None)
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_seconds': time.time() - self.started,
+            'stages': stages,
+            'files': self.files,
+            'counters': dict(self.all_counters()),
+        }
+
+    def all_counters(self):
+        counters = Counter(self.counters)
+        for key in ('difflib_ratio', 'difflib_quick_ratio', 'indel_ratio'):
+            counters['similarity_calls_' + key] = SIMILARITY_CALLS[key] - self.similarity_start[key]
+        return counters
+
+    def report(self):
+        print("=============运行指标=============\n")
+        print("{:<16}{:>10}{:>10}{:>10}{:>12}".format("阶段", "墙钟(秒)", "CPU(秒)", "行数", "行/秒"))
+        for name, record in self.summary()['stages'].items():
+            print("{:<16}{:>10.2f}{:>10.2f}{:>10}{:>12}".format(
+                name, record['wall_seconds'], record['cpu_seconds'], record['rows'],
+                "{:.0f}".format(record['rows_per_second']) if record['rows_per_second'] else "-"
+            ))
+        counters = self.all_counters()
+        if any(counters.values()):
+            print("SequenceMatcher.ratio: {}\t\tquick_ratio: {}\t\tIndel: {}\t\t匹配缓存命中: {}".format(
+                counters['similarity_calls_difflib_ratio'], counters['similarity_calls_difflib_quick_ratio'],
+                counters['similarity_calls_indel_ratio'], counters['match_cache_hits']
+            ))
+        print()
+
+    def save(self, path=METRICS_FILE):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        print("运行指标已写入{}\n".format(path))
+
+
+METRICS = Metrics()
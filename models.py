@@ -1,14 +1,31 @@
 import sys
+import time
+from collections import Counter
 from difflib import SequenceMatcher
 
-import xlrd
-
+from readers import open_reader
+from similarity import SIMILARITY_CALLS, IndelPattern
 from settings import *
 
 
+PROGRESS = {'enabled': SHOW_PROGRESS, 'interval': PROGRESS_INTERVAL, 'last': 0.0}
+
+
+def set_progress(enabled=True, interval=PROGRESS_INTERVAL):
+    PROGRESS['enabled'] = enabled
+    PROGRESS['interval'] = interval
+
+
 def show_progress(iteration, total,
                   prefix='Progress', suffix='Complete',
                   decimals=1, length=50, fill='█'):
+    # 按时间限流: 两次刷新至少间隔 interval 秒, 完成时总会刷新
+    if not PROGRESS['enabled']:
+        return
+    now = time.monotonic()
+    if iteration != total and now - PROGRESS['last'] < PROGRESS['interval']:
+        return
+    PROGRESS['last'] = 0.0 if iteration == total else now
     precision = "0:.{}f".format(decimals)
     pattern = "{{{}}}".format(precision)
     percent = pattern.format(100 * (iteration / float(total)))
@@ -20,19 +37,113 @@ def show_progress(iteration, total,
         print()
 
 
+# 逐级淘汰统计: candidates 为参与比较的商品数, length/quick/ratio 为各级淘汰数
+MATCH_COUNTERS = Counter()
+
+
+def length_bound(a, b):
+    total = len(a) + len(b)
+    if not total:
+        return 1.0
+    return 2.0 * min(len(a), len(b)) / total
+
+
+# 取值种类远少于行数的字段: 相同取值共用一个字符串对象, 并按字段分配整数编码
+POOLED_FIELDS = ('vendor', 'client', 'manufacturer', 'dose', 'year', 'month', 'source')
+
+
+# 字符串池: 每个取值只保留一个对象, 编码为首次出现的顺序.
+# pickle 对同一对象只写一次, 读取后各行仍然共用; 旧数据文件在 __setstate__ 中重新入池
+class StringPool:
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def intern(self, value):
+        if not isinstance(value, str):
+            return value
+        return self.values[self.code(value)]
+
+
+STRING_POOLS = {field: StringPool() for field in POOLED_FIELDS}
+
+_ALL_SLOTS = {}
+_POOLED_SLOTS = {}
+
+
 class Item:
     KEY_HEADERS = {}
     REVERSE_HEADERS = {}
     VALIDATE_FIELDS = []
 
+    # 使用 __slots__ 代替每个实例的 __dict__; 未赋值的字段默认为 None
+    __slots__ = (
+        'name', 'dose', 'manufacturer', 'serial',
+        'potential_matches', 'potential_scores', 'scanned', 'unlikely', 'errors',
+        'match_type', 'match_score', 'difflib_score', '_matchers',
+    )
+
     def __init__(self, *args, **kwargs):
-        self.potential_matches = []
-        self.scanned = False
-        self.unlikely = False
+        self._set_defaults()
         for key in kwargs:
             value = str(kwargs[key]).lower()
             self.__setattr__(key, value)
 
+    @classmethod
+    def all_slots(cls):
+        if cls not in _ALL_SLOTS:
+            slots = []
+            for klass in reversed(cls.__mro__):
+                slots.extend(klass.__dict__.get('__slots__', ()))
+            _ALL_SLOTS[cls] = tuple(slots)
+        return _ALL_SLOTS[cls]
+
+    @classmethod
+    def pooled_slots(cls):
+        if cls not in _POOLED_SLOTS:
+            _POOLED_SLOTS[cls] = tuple(slot for slot in cls.all_slots() if slot in STRING_POOLS)
+        return _POOLED_SLOTS[cls]
+
+    def intern_fields(self):
+        for field in self.pooled_slots():
+            setattr(self, field, STRING_POOLS[field].intern(getattr(self, field)))
+
+    def _set_defaults(self):
+        for slot in self.all_slots():
+            setattr(self, slot, None)
+        self.potential_matches = []
+        self.potential_scores = []
+        self.scanned = False
+        self.unlikely = False
+
+    def __getstate__(self):
+        state = {}
+        for slot in self.all_slots():
+            value = getattr(self, slot)
+            if value is not None and slot != '_matchers':
+                state[slot] = value
+        return state
+
+    def __setstate__(self, state):
+        # 同时兼容旧版本基于 __dict__ 的 pickle 文件: 状态同样是字段字典
+        self._set_defaults()
+        slots = set(self.all_slots())
+        for key, value in state.items():
+            if key in slots:
+                setattr(self, key, value)
+        self.intern_fields()
+
     def validate(self):
         self.errors = {}
         valid = True
@@ -64,6 +175,9 @@ class Item:
         self.name = self.name.lower()
         self.dose = str(self.dose).lower()
         self.manufacturer = str(self.manufacturer).lower()
+        self.intern_fields()
+        # 字段已改变, 丢弃按旧取值缓存的比较字段
+        self._matchers = None
 
         try:
             self.amount = float(self.amount)
@@ -81,39 +195,150 @@ class Item:
     def get_product_info(self):
         return "{}{}{}".format(self.name, self.dose, self.manufacturer).lower()
 
-    def match_product(self, product):
-
-        def get_similarity(a, b):
-            a, b = str(a), str(b)
-            return SequenceMatcher(None, a, b).ratio()
-
-        def check_similarity(similarities, threshold):
-            for sim in similarities:
-                if sim < threshold:
-                    return False
-            return True
-
-        similarities = [0, 0, 0]
-        similarities[0] = get_similarity(self.name, product.name)
-        similarities[1] = get_similarity(self.dose, product.dose)
-        similarities[2] = get_similarity(self.manufacturer, product.manufacturer)
+    @property
+    def product_key(self):
+        fields = (self.name, self.dose, self.manufacturer)
+        return tuple("" if f is None else str(f).strip().lower() for f in fields)
+
+    def similarity_fields(self):
+        # 与 matcher/pattern 一样缓存在 _matchers 中: 与整个候选列表比较时只拼接一次
+        if self._matchers is None:
+            self._matchers = {}
+        fields = self._matchers.get('fields')
+        if fields is None:
+            fields = self._matchers['fields'] = self._similarity_fields()
+        return fields
+
+    def _similarity_fields(self, info=None):
         if self.dose is None:
             self.dose = ""
-        if product.dose is None:
-            product.dose = ""
-        this = self.name + str(self.dose) + self.manufacturer
-        pd = product.name + str(product.dose) + product.manufacturer
-        overall = get_similarity(this, pd)
+        return {
+            'name': str(self.name),
+            'dose': str(self.dose),
+            'manufacturer': str(self.manufacturer),
+            'info': self.name + str(self.dose) + self.manufacturer if info is None else info,
+        }
+
+    def set_info(self, info):
+        # 编译后的商品目录中预先拼接好的 info(见 CompiledCatalog.products), 直接放入缓存
+        if self._matchers is None:
+            self._matchers = {}
+        self._matchers['fields'] = self._similarity_fields(info)
+
+    def matcher(self, field):
+        # 以本商品为 seq2 的 SequenceMatcher, 其 b2j/fullbcount 缓存在所有比较中复用
+        if self._matchers is None:
+            self._matchers = {}
+        if field not in self._matchers:
+            self._matchers[field] = SequenceMatcher(None, '', self.similarity_fields()[field])
+        return self._matchers[field]
+
+    def pattern(self, field):
+        # 以本数据为模式串的位掩码, 与整个目录比较时只计算一次
+        if self._matchers is None:
+            self._matchers = {}
+        key = 'pattern', field
+        if key not in self._matchers:
+            self._matchers[key] = IndelPattern(self.similarity_fields()[field])
+        return self._matchers[key]
+
+    def clear_suggestions(self):
+        self.potential_matches = []
+        self.potential_scores = []
+
+    def add_suggestion(self, product, score, limit=SUGGESTION_LIMIT):
+        # 候选商品与匹配时的整体相似度一起保存, 按得分从高到低最多保留 limit 个,
+        # 得分相同时先加入的在前
+        scores = self.potential_scores
+        i = len(scores)
+        while i > 0 and scores[i - 1] < score:
+            i -= 1
+        if i >= limit:
+            return
+        scores.insert(i, score)
+        self.potential_matches.insert(i, product)
+        del scores[limit:]
+        del self.potential_matches[limit:]
+
+    def suggestions(self, limit=SUGGESTION_LIMIT):
+        # 旧数据文件中的候选没有保存得分, 此时现场计算并排序
+        if len(self.potential_scores) != len(self.potential_matches):
+            SIMILARITY_CALLS['difflib_ratio'] += len(self.potential_matches) - self.potential_matches.count(None)
+            self.potential_scores = [
+                0 if p is None else SequenceMatcher(None, self.get_product_info, p.get_product_info).ratio()
+                for p in self.potential_matches
+            ]
+            order = sorted(range(len(self.potential_scores)), key=lambda i: -self.potential_scores[i])
+            self.potential_matches = [self.potential_matches[i] for i in order]
+            self.potential_scores = [self.potential_scores[i] for i in order]
+        return [p for p in self.potential_matches[:limit] if p is not None]
+
+    def match_product(self, product, thresholds=MATCH_THRESHOLDS, best=None, kernel=SIMILARITY_KERNEL):
+        # best: 当前最好的整体相似度. 给出时, 既不可能匹配/列为候选,
+        # 也不可能超过 best 的商品在计算完整 ratio 之前即被淘汰.
+        # kernel: 完整相似度的算法; 前两级上界对两种算法都成立.
+        fields = ('name', 'dose', 'manufacturer')
+        this = self.similarity_fields()
+        that = product.similarity_fields()
+        MATCH_COUNTERS['candidates'] += 1
+
+        def hopeless(overall_bound, fields_possible):
+            if best is None or fields_possible:
+                return False
+            return overall_bound < thresholds['potential'] and overall_bound <= best
+
+        def reject(tier):
+            MATCH_COUNTERS[tier] += 1
+            self.unlikely = True
 
-        if check_similarity(similarities, .7):
+        # 第一级: 长度上界 (与 real_quick_ratio 相同, 无需构造 SequenceMatcher)
+        fields_possible = all(length_bound(this[f], that[f]) >= thresholds['field'] for f in fields)
+        if hopeless(length_bound(this['info'], that['info']), fields_possible):
+            return reject('length')
+
+        # 第二级: quick_ratio (字符多重集交集); Indel 相似度本身与 quick_ratio 代价相当, 不再单独估计上界
+        if kernel == 'indel':
+            def ratio(f):
+                SIMILARITY_CALLS['indel_ratio'] += 1
+                return self.pattern(f).ratio(that[f])
+        else:
+            overall_matcher = product.matcher('info')
+            overall_matcher.set_seq1(this['info'])
+            if fields_possible:
+                for f in fields:
+                    field_matcher = product.matcher(f)
+                    field_matcher.set_seq1(this[f])
+                    SIMILARITY_CALLS['difflib_quick_ratio'] += 1
+                    if field_matcher.quick_ratio() < thresholds['field']:
+                        fields_possible = False
+                        break
+            SIMILARITY_CALLS['difflib_quick_ratio'] += 1
+            if hopeless(overall_matcher.quick_ratio(), fields_possible):
+                return reject('quick')
+
+            def ratio(f):
+                SIMILARITY_CALLS['difflib_ratio'] += 1
+                return product.matcher(f).ratio()
+
+        # 第三级: 完整 ratio
+        if fields_possible:
+            for f in fields:
+                if ratio(f) < thresholds['field']:
+                    fields_possible = False
+                    break
+        if fields_possible:
             self.serial = product.serial
             self.scanned = True
-        elif overall >= .8:
+            return
+
+        overall = ratio('info')
+        if overall >= thresholds['overall']:
             self.serial = product.serial
             self.scanned = True
-        elif overall >= .5:
-            self.potential_matches.append(product)
+        elif overall >= thresholds['potential']:
+            self.add_suggestion(product, overall)
         else:
+            MATCH_COUNTERS['ratio'] += 1
             self.unlikely = True
             return overall
 
@@ -128,7 +353,7 @@ class Product(Item):
     REVERSE_HEADERS = dict(zip(KEY_HEADERS.values(), KEY_HEADERS.keys()))
     VALIDATE_FIELDS = ['serial', 'name']
 
-    name, manufacturer, dose, serial = None, None, None, None
+    __slots__ = ()
 
     def __repr__(self):
         return "<商品 品名={} 规格={} 生产企业={}, 编号={}>".format(self.name, self.dose, self.manufacturer, self.serial)
@@ -149,10 +374,7 @@ class Purchase(Item):
     REVERSE_HEADERS = dict(zip(KEY_HEADERS.values(), KEY_HEADERS.keys()))
     VALIDATE_FIELDS = ['vendor', 'name', 'amount']
 
-    vendor, name, dose = None, None, None
-    serial, manufacturer, amount = None, None, None
-    year, month = None, None
-    _price, unit_price = None, None
+    __slots__ = ('vendor', 'amount', 'year', 'month', 'row', 'source', '_price', 'unit_price')
 
     @property
     def time(self):
@@ -195,9 +417,7 @@ class Sales(Item):
     REVERSE_HEADERS = dict(zip(KEY_HEADERS.values(), KEY_HEADERS.keys()))
     VALIDATE_FIELDS = ['client', 'name', 'amount', 'total_price']
 
-    client, name, dose = None, None, None
-    manufacturer, amount, total_price = None, None, None
-    serial, year, month = None, None, None
+    __slots__ = ('client', 'amount', 'year', 'month', 'row', 'source', 'total_price')
 
     @property
     def unit_price(self):
@@ -241,23 +461,33 @@ class SourceFile:
     def __init__(self, file_path):
         if not file_path.startswith(DATA_ROOT):
             file_path = os.path.join(DATA_ROOT, file_path)
+        self.file_path = file_path
         self.file_dir, self.file_name = os.path.dirname(file_path), os.path.basename(file_path)
-        # print("正在载入文件{}...".format(self.file_name))
 
-        self.book = xlrd.open_workbook(file_path)
-        self.sheet = self.book.sheet_by_index(0)
+        # 工作簿在读取数据时才打开, 读完即释放
+        self.reader = None
+        self.header_col = 0
+        self.items = None
         self.error_items = []
 
-        # print("文件载入成功!\n")
+    def open(self):
+        if self.reader is None:
+            self.reader = open_reader(self.file_path)
+        return self.reader
+
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
 
     def set_header(self, x):
         self.header_col = x
-        header_line = self.sheet.row(x)
+
+    def _read_header(self, header_line):
         self.header2idx = {}
         self.idx2header = {}
         for i, header in enumerate(header_line):
-            header = header.value
-            if not len(header):
+            if not isinstance(header, str) or not len(header):
                 continue
             self.header2idx[header] = i
             self.idx2header[i] = header
@@ -266,40 +496,51 @@ class SourceFile:
         self.year, self.month = year, month
 
     def extract_data(self, model_class):
-        rows, cols = self.sheet.nrows, self.sheet.ncols
-        print("开始读取文件数据, 共有 {} 行 {} 列".format(rows, cols))
-        items = []
-        brokens = []
-        for i in range(self.header_col + 1, rows):
-            row = self.sheet.row(i)
-            if self.year and self.month:
-                fields = {
-                    'year': self.year,
-                    'month': self.month,
-                    'row': i
-                }
-            else:
-                fields = {}
-            for key, val in model_class.KEY_HEADERS.items():
-                if key not in self.header2idx:
+        # 逐行生成通过校验的数据, 无效数据记录在 error_items 中
+        reader = self.open()
+        try:
+            print("开始读取文件数据, 共有 {} 行 {} 列".format(reader.nrows, reader.ncols))
+            count = 0
+            self.error_items = []
+            for i, row in reader.rows():
+                if i < self.header_col:
                     continue
-                value = row[self.header2idx[key]].value
-                fields[val] = value
-            item = model_class(**fields)
-            if item.is_valid():
-                items.append(item)
-            else:
-                brokens.append((i, item))
-        self.items = items
-
-        self.error_items = brokens
+                if i == self.header_col:
+                    self._read_header(row)
+                    continue
+                if self.year and self.month:
+                    fields = {
+                        'year': self.year,
+                        'month': self.month,
+                        'row': i
+                    }
+                else:
+                    fields = {}
+                for key, val in model_class.KEY_HEADERS.items():
+                    if key not in self.header2idx:
+                        continue
+                    j = self.header2idx[key]
+                    fields[val] = row[j] if j < len(row) else ''
+                item = model_class(**fields)
+                item.intern_fields()
+                if item.is_valid():
+                    count += 1
+                    yield item
+                else:
+                    self.error_items.append((i, item))
+        finally:
+            self.close()
 
         print("\n读取完成, {}共生成{}组数据.\n".format(
-            "检测到{}组无效数据, ".format(len(brokens)) if len(brokens) else "",
-            len(items)
+            "检测到{}组无效数据, ".format(len(self.error_items)) if len(self.error_items) else "",
+            count
         ))
 
-    def find_serial(self, products):
+    def read_items(self, model_class):
+        self.items = list(self.extract_data(model_class))
+        return self.items
+
+    def find_serial(self, products, index=None):
         total = len(products)
         no_matches = 0
 
@@ -307,7 +548,8 @@ class SourceFile:
         print('\t文件中共{}条数据需处理'.format(total_progress))
         show_progress(0, total_progress)
         for i, item in enumerate(self.items):
-            for product in products:
+            candidates = products if index is None else index.shortlist(item)
+            for product in candidates:
                 item.match_product(product)
                 if item.has_serial():
                     break
@@ -0,0 +1,227 @@
+import queue
+import threading
+import time
+
+from matcher import start_pool
+from metrics import METRICS
+from models import STRING_POOLS, Purchase, Sales
+from utils import batch_purchases, group_sales, save_data, source_key, write_match_errors
+from settings import *
+
+ERROR_REPORTS = {
+    'purchase': ('采购', '采购数据整理建议'),
+    'sales': ('销售', '销售数据整理建议'),
+}
+DATA_FILES = {'purchase': PURCHASE_FILE, 'sales': SALES_FILE}
+
+
+# 流水线中的一个阶段: 在单独的线程中运行, 通过有界队列与上下游相连.
+# 等待队列(上游没有数据或下游已满)的时间单独统计, 其余时间视为忙碌,
+# 忙碌时间占比即该阶段的利用率, 利用率最高的阶段就是瓶颈.
+class Stage:
+
+    def __init__(self, name):
+        self.name = name
+        self.waiting = 0.0
+        self.started = None
+        self.finished = None
+        self.cpu = 0.0
+        self.batches = 0
+        self.rows = 0
+        self.error = None
+
+    def get(self, source):
+        start = time.perf_counter()
+        message = source.get()
+        self.waiting += time.perf_counter() - start
+        return message
+
+    def put(self, target, message):
+        start = time.perf_counter()
+        target.put(message)
+        self.waiting += time.perf_counter() - start
+
+    @property
+    def wall(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def utilization(self):
+        return (self.wall - self.waiting) / self.wall if self.wall else 0.0
+
+
+# 流水线: 读取(含预处理) -> 匹配 -> 写出(整理建议 + 导出表).
+# 队列中传递的消息:
+#   ('items', 类型, 一批数据)
+#   ('year_done', 类型, 年份)  该类型该年份的文件已全部读完, 写出阶段可以导出这一年
+#   None                      结束
+class Pipeline:
+
+    def __init__(self, matcher, queue_size=PIPELINE_QUEUE_SIZE, batch_size=PIPELINE_BATCH_SIZE,
+                 match_workers=MATCH_WORKERS, export_workers=EXPORT_WORKERS):
+        self.matcher = matcher
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.match_workers = match_workers
+        self.export_workers = export_workers
+        self.stages = [Stage('ingest'), Stage('match'), Stage('write')]
+        self.executor = None
+        self.results = {'purchase': [], 'sales': []}
+        self.failures = []
+
+    # ==============各阶段================
+
+    def _ingest(self, stage, jobs, target):
+        for kind, model_class, sheets in jobs:
+            sheets = sorted(sheets, key=lambda job: (int(job[0]), int(job[1]), job[2].file_name))
+            current_year = None
+            for year, month, sheet in sheets:
+                if current_year is not None and year != current_year:
+                    stage.put(target, ('year_done', kind, current_year))
+                current_year = year
+                sheet.set_header(0)
+                sheet.set_time(year, month)
+                source = STRING_POOLS['source'].intern(source_key(sheet.file_path))
+                batch = []
+                for item in sheet.extract_data(model_class):
+                    item.source = source
+                    item.normalize_product_info()
+                    item.validate_data()
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        stage.put(target, ('items', kind, batch))
+                        stage.batches += 1
+                        stage.rows += len(batch)
+                        batch = []
+                if batch:
+                    stage.put(target, ('items', kind, batch))
+                    stage.batches += 1
+                    stage.rows += len(batch)
+                sheet.save_error()
+            if current_year is not None:
+                stage.put(target, ('year_done', kind, current_year))
+
+    def _match(self, stage, source, target):
+        while True:
+            message = stage.get(source)
+            if message is None:
+                return
+            if message[0] == 'items':
+                batch = message[2]
+                self.matcher.match_all(batch, workers=self.match_workers, executor=self.executor)
+                stage.batches += 1
+                stage.rows += len(batch)
+            stage.put(target, message)
+
+    def _write(self, stage, source):
+        errors = {kind: [] for kind in ERROR_REPORTS}
+        numbers = {kind: 1 for kind in ERROR_REPORTS}
+        exports = {kind: {} for kind in ERROR_REPORTS}
+
+        def write_errors(kind):
+            error_type, prefix = ERROR_REPORTS[kind]
+            write_match_errors(errors[kind], error_type, "{}{}.xlsx".format(prefix, numbers[kind]))
+            errors[kind] = []
+            numbers[kind] += 1
+
+        while True:
+            message = stage.get(source)
+            if message is None:
+                break
+            action, kind, payload = message
+            if action == 'items':
+                self.results[kind].extend(payload)
+                for item in payload:
+                    if item.has_serial():
+                        exports[kind].setdefault(item.year, []).append(item)
+                        continue
+                    errors[kind].append(item)
+                    if len(errors[kind]) >= SUGGESTION_ITEMS_PER_FILE:
+                        write_errors(kind)
+                stage.batches += 1
+                stage.rows += len(payload)
+            else:
+                # 一年的数据读完即可导出, 导出文件按(供应商/客户, 年份)划分, 与整体导出的结果相同
+                items = exports[kind].pop(payload, [])
+                if kind == 'purchase':
+                    self.failures += batch_purchases(items, workers=self.export_workers)
+                else:
+                    items = [item for item in items if float(item.total_price) >= 0]
+                    self.failures += group_sales(items, workers=self.export_workers)
+
+        for kind in ERROR_REPORTS:
+            if errors[kind] or numbers[kind] == 1:
+                write_errors(kind)
+
+    def _run_stage(self, stage, func, source, target, *args):
+        stage.started = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            func(stage, *args)
+        except Exception as e:
+            stage.error = e
+            # 出错后继续取走上游的消息, 避免上游阻塞在已满的队列上
+            if source is not None:
+                while stage.get(source) is not None:
+                    pass
+        finally:
+            if target is not None:
+                stage.put(target, None)
+            stage.finished = time.perf_counter()
+            stage.cpu = time.thread_time() - cpu
+
+    # ==============运行================
+
+    def run(self, purchase_sheets, sales_sheets):
+        jobs = [('purchase', Purchase, purchase_sheets), ('sales', Sales, sales_sheets)]
+        to_match = queue.Queue(maxsize=self.queue_size)
+        to_write = queue.Queue(maxsize=self.queue_size)
+        ingest, match, write = self.stages
+        # 各批数据共用一个进程池: 子进程只启动、载入商品目录一次, 且在各阶段线程启动前创建
+        if self.match_workers > 1 and self.matcher.tfidf is None:
+            self.executor = start_pool(self.matcher, workers=self.match_workers)
+        threads = [
+            threading.Thread(target=self._run_stage, args=(ingest, self._ingest, None, to_match, jobs, to_match)),
+            threading.Thread(target=self._run_stage, args=(match, self._match, to_match, to_write, to_match, to_write)),
+            threading.Thread(target=self._run_stage, args=(write, self._write, to_write, None, to_write)),
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+        for kind, items in self.results.items():
+            save_data(items, DATA_FILES[kind])
+        self.matcher.save_cache()
+        self.report()
+        return self.results
+
+    def report(self):
+        print("=============流水线各阶段=============\n")
+        print("{:<10}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}".format(
+            "阶段", "用时(秒)", "CPU(秒)", "等待(秒)", "利用率", "批次", "行数"))
+        for stage in self.stages:
+            print("{:<10}{:>10.2f}{:>10.2f}{:>10.2f}{:>9.0f}%{:>10}{:>10}".format(
+                stage.name, stage.wall, stage.cpu, stage.waiting, 100 * stage.utilization, stage.batches, stage.rows
+            ))
+            METRICS.stages['pipeline_' + stage.name] = {
+                'wall_seconds': stage.wall,
+                'cpu_seconds': stage.cpu,
+                'busy_seconds': stage.wall - stage.waiting,
+                'utilization': stage.utilization,
+                'rows': stage.rows,
+                'runs': 1,
+            }
+        bottleneck = max(self.stages, key=lambda stage: stage.utilization)
+        print("\n瓶颈: {}\n".format(bottleneck.name))
+        if self.failures:
+            print("导出失败{}组\n".format(len(self.failures)))
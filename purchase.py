@@ -7,6 +7,7 @@ import sys
 
 import pickle
 
+from journal import MatchJournal
 from models import SourceFile, Product, Purchase, Sales, show_progress
 from settings import *
 
@@ -37,7 +38,7 @@ def load_products(reload=False):
     if reload:
         index_sheet = SourceFile('index_new.xls')
         index_sheet.set_header(0)
-        index_sheet.extract_data(model_class=Product)
+        index_sheet.read_items(model_class=Product)
         products = index_sheet.items
         save_data(products, "product_list.pickle")
     else:
@@ -48,7 +49,7 @@ def load_products(reload=False):
     if not products:
         index_sheet = SourceFile('index_new.xls')
         index_sheet.set_header(0)
-        index_sheet.extract_data(model_class=Product)
+        index_sheet.read_items(model_class=Product)
         products = index_sheet.items
     return products
 
@@ -58,7 +59,7 @@ if __name__ == '__main__':
     # ==============商品目录处理===============
     index_sheet = SourceFile('index_new.xls')
     index_sheet.set_header(0)
-    index_sheet.extract_data(model_class=Product)
+    index_sheet.read_items(model_class=Product)
     products = index_sheet.items
     # index_sheet.save_error()
 
@@ -98,7 +99,7 @@ if __name__ == '__main__':
         for year, month, sheet in purchase_sheets:
             sheet.set_header(0)
             sheet.set_time(year, month)
-            sheet.extract_data(model_class=Purchase)
+            sheet.read_items(model_class=Purchase)
             sheet.save_error()
         print("模型生成完成!\n")
 
@@ -107,7 +108,7 @@ if __name__ == '__main__':
         for year, month, sheet in sales_sheets:
             sheet.set_header(0)
             sheet.set_time(year, month)
-            sheet.extract_data(model_class=Sales)
+            sheet.read_items(model_class=Sales)
             sheet.save_error()
         print("模型生成完成!\n")
 
@@ -124,12 +125,13 @@ if __name__ == '__main__':
     print("\t共有{}条采购数据待处理".format(num_purchases))
     show_progress(0, num_purchases)
 
+    journal = MatchJournal("purchase_list.pickle")
+    journal.replay(purchase_list, products)
+
     count = 0
     for i, item in enumerate(purchase_list):
         if (i + 1) % 5 == 0:
             show_progress(i + 1, num_purchases)
-        if i + 1 > 0 and (i + 1) % 500 == 0:
-            save_data(purchase_list, "purchase_list.pickle")
 
         if item.processed():
             count += 1
@@ -143,7 +145,12 @@ if __name__ == '__main__':
                 break
         if not item.has_serial():
             no_matches += 1
+        journal.record(item)
+        if journal.records >= JOURNAL_COMPACT_EVERY:
+            journal.compact(purchase_list)
 
+    journal.compact(purchase_list)
+    journal.close()
     print()
     print(count)
 
@@ -0,0 +1,328 @@
+import os
+import re
+import zipfile
+from xml.etree.ElementTree import iterparse
+from xml.parsers import expat
+
+import xlrd
+from xlrd.xlsx import XML_WHITESPACE, error_code_from_text, unescape
+
+from settings import *
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# expat 以 namespace_separator='}' 解析时的标签名
+ROW_TAG, C_TAG, V_TAG = MAIN_NS[1:] + 'row', MAIN_NS[1:] + 'c', MAIN_NS[1:] + 'v'
+T_TAG, SI_TAG, RPH_TAG = MAIN_NS[1:] + 't', MAIN_NS[1:] + 'si', MAIN_NS[1:] + 'rPh'
+MERGE_TAG = MAIN_NS[1:] + 'mergeCell'
+XML_SPACE = 'http://www.w3.org/XML/1998/namespace}space'
+READ_CHUNK_SIZE = 1 << 16
+
+# 有取值的单元格(与 xlrd 相同: 公式文本、布尔值、错误值, 或 <v> 非空, 或内联文本)和合并单元格,
+# 用于在不逐个回调的情况下统计行列数. 只适用于 Excel 的写法: 没有命名空间前缀, r 是第一个属性;
+# CELL_TAG 匹配任意写法的单元格标签, 两者数量不一致时改用 expat 逐个元素统计
+CELL_TAG = re.compile(rb'<(?:[\w.-]+:)?c[\s/>]')
+CANONICAL_CELL = b'<c r="'
+FILLED_CELL = re.compile(
+    rb'<c r="([A-Z]+)(\d+)"(?:[^>]*?t="(?:str|b|e)"|[^>]*>(?:<f[^>]*?(?:/>|>[^<]*</f>))?<(?:v>[^<]|is>))')
+MERGE_CELL = re.compile(rb'<mergeCell ref="(?:[A-Z]+\d+:)?([A-Z]+)(\d+)"')
+
+
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index - 1
+
+
+def cooked_text(chunks, attrs):
+    # 与 xlrd 相同: 未声明 xml:space="preserve" 的文本去掉首尾空白, 再还原 _xHHHH_ 转义
+    text = ''.join(chunks)
+    if attrs.get(XML_SPACE) != 'preserve':
+        text = text.strip(XML_WHITESPACE)
+    return unescape(text)
+
+
+# 旧版 .xls 文件: 仍由 xlrd 读取, 按需加载工作表
+class XlrdReader:
+
+    def __init__(self, file_path):
+        self.book = xlrd.open_workbook(file_path, on_demand=True)
+        self.sheet = self.book.sheet_by_index(0)
+        self.nrows, self.ncols = self.sheet.nrows, self.sheet.ncols
+
+    def rows(self):
+        for i in range(self.nrows):
+            yield i, [cell.value for cell in self.sheet.row(i)]
+
+    def close(self):
+        self.book.release_resources()
+
+
+# 统计工作表实际的行列数(expat 回调): 与 xlrd 相同, 只计入有取值的单元格和合并单元格,
+# 单元格和行缺少 r 属性时按顺序推算
+class _ExtentHandler:
+
+    def __init__(self):
+        self.nrows = self.ncols = 0
+        self.next_row = 0
+        self.row_index = self.col = -1
+        self.kind = None
+        self.filled = False
+        self.capture = False
+        self.preserve = False
+
+    def start(self, tag, attrs):
+        if tag == C_TAG:
+            ref = attrs.get('r')
+            self.col = column_index(ref.rstrip('0123456789')) if ref else self.col + 1
+            self.kind = attrs.get('t', 'n')
+            # 公式文本、布尔值和错误值即使没有取值也会生成单元格
+            self.filled = self.kind in ('str', 'b', 'e')
+        elif tag == V_TAG or tag == T_TAG:
+            self.capture = True
+            self.preserve = attrs.get(XML_SPACE) == 'preserve'
+        elif tag == ROW_TAG:
+            r = attrs.get('r')
+            self.row_index = int(r) - 1 if r else self.next_row
+            self.col = -1
+        elif tag == MERGE_TAG:
+            for ref in attrs.get('ref', '').split(':'):
+                letters = ref.rstrip('0123456789')
+                if letters and ref[len(letters):]:
+                    self.nrows = max(self.nrows, int(ref[len(letters):]))
+                    self.ncols = max(self.ncols, column_index(letters) + 1)
+
+    def data(self, text):
+        if self.capture and (self.preserve or self.kind != 'inlineStr' or text.strip(XML_WHITESPACE)):
+            self.filled = True
+
+    def end(self, tag):
+        if tag == C_TAG:
+            if self.filled:
+                self.nrows = max(self.nrows, self.row_index + 1)
+                self.ncols = max(self.ncols, self.col + 1)
+        elif tag == V_TAG or tag == T_TAG:
+            self.capture = False
+        elif tag == ROW_TAG:
+            self.next_row = self.row_index + 1
+
+
+# 工作表 XML 的 expat 回调: 逐个单元格累积当前行, 整行结束后补齐/截断到 width 列放入 done
+class _SheetHandler:
+
+    def __init__(self, strings, width):
+        self.strings = strings
+        self.width = width
+        self.columns = {}
+        self.done = []
+        self.next_row = 0
+        self.values = None
+        self.kind = None
+        self.text = None
+        self.chunks = None
+        self.attrs = None
+
+    def column(self, ref):
+        letters = ref.rstrip('0123456789')
+        if letters not in self.columns:
+            self.columns[letters] = column_index(letters)
+        return self.columns[letters]
+
+    def start(self, tag, attrs):
+        if tag == C_TAG:
+            ref = attrs.get('r')
+            j = self.column(ref) if ref else len(self.values)
+            if j > len(self.values):
+                self.values.extend([''] * (j - len(self.values)))
+            self.kind = attrs.get('t', 'n')
+            self.text = None
+        elif tag == V_TAG or tag == T_TAG:
+            if self.text is None:
+                self.text = []
+            self.chunks = []
+            self.attrs = attrs
+        elif tag == ROW_TAG:
+            r = attrs.get('r')
+            self.row_index = int(r) - 1 if r else self.next_row
+            self.values = []
+
+    def data(self, text):
+        if self.chunks is not None:
+            self.chunks.append(text)
+
+    def end(self, tag):
+        if tag == C_TAG:
+            self.values.append(self.value())
+        elif tag == T_TAG or (tag == V_TAG and self.kind == 'str'):
+            self.text.append(cooked_text(self.chunks, self.attrs))
+            self.chunks = None
+        elif tag == V_TAG:
+            self.text.append(''.join(self.chunks))
+            self.chunks = None
+        elif tag == ROW_TAG:
+            values = self.values
+            if len(values) < self.width:
+                values.extend([''] * (self.width - len(values)))
+            elif len(values) > self.width:
+                del values[self.width:]
+            self.done.append((self.row_index, values))
+            self.next_row = self.row_index + 1
+
+    def value(self):
+        if self.text is None:
+            return '#N/A' if self.kind == 'e' else ''
+        raw, kind = ''.join(self.text), self.kind
+        if not raw and kind in ('n', 's'):
+            return ''
+        if kind == 'n':
+            return float(raw)
+        if kind == 's':
+            return self.strings[int(raw)]
+        if kind == 'b':
+            return int(raw)
+        if kind == 'e':
+            return error_code_from_text.get(raw, raw)
+        # inlineStr / str(公式结果)
+        return raw
+
+
+# .xlsx 文件: 直接从压缩包中流式解析工作表 XML, 内存中只保留共享字符串表和当前数据块.
+# 单元格取值与 xlrd 的 cell.value 一致: 数字(含日期)为 float, 文本为 str(首尾空白的处理相同),
+# 布尔值为 0/1, 空单元格为 '', 行之间的空行同样会生成; 行列数也按 xlrd 的规则统计, 末尾的空行空列不计入.
+class XlsxReader:
+
+    def __init__(self, file_path):
+        self.archive = zipfile.ZipFile(file_path)
+        self.sheet_path = self._first_sheet()
+        self.strings = self._shared_strings()
+        self.nrows, self.ncols = self._extent()
+
+    def _first_sheet(self):
+        with self.archive.open('xl/workbook.xml') as f:
+            for _, elem in iterparse(f):
+                if elem.tag == MAIN_NS + 'sheet':
+                    rel_id = elem.get(REL_NS + 'id')
+                    break
+        with self.archive.open('xl/_rels/workbook.xml.rels') as f:
+            for _, elem in iterparse(f):
+                if elem.tag == PKG_REL_NS + 'Relationship' and elem.get('Id') == rel_id:
+                    target = elem.get('Target')
+                    break
+        if target.startswith('/'):
+            return target[1:]
+        return os.path.normpath(os.path.join('xl', target)).replace(os.sep, '/')
+
+    def _shared_strings(self):
+        if 'xl/sharedStrings.xml' not in self.archive.namelist():
+            return []
+        strings, parts = [], []
+        state = {'chunks': None, 'attrs': None, 'phonetic': False}
+
+        def start(tag, attrs):
+            if tag == SI_TAG:
+                del parts[:]
+            elif tag == RPH_TAG:
+                # 注音文本不属于单元格内容
+                state['phonetic'] = True
+            elif tag == T_TAG and not state['phonetic']:
+                state['chunks'], state['attrs'] = [], attrs
+
+        def end(tag):
+            if tag == SI_TAG:
+                strings.append(''.join(parts))
+            elif tag == RPH_TAG:
+                state['phonetic'] = False
+            elif tag == T_TAG and state['chunks'] is not None:
+                parts.append(cooked_text(state['chunks'], state['attrs']))
+                state['chunks'] = None
+
+        def data(text):
+            if state['chunks'] is not None:
+                state['chunks'].append(text)
+
+        parser = self._parser(start, end, data)
+        with self.archive.open('xl/sharedStrings.xml') as f:
+            parser.ParseFile(f)
+        return strings
+
+    def _extent(self):
+        # 行列数不能直接使用 dimension: 其中包含末尾只有格式的空行空列.
+        # 先用正则扫描一遍解压后的 XML, 比 expat 逐个元素回调快得多; 每块只处理到最后一个单元格之前.
+        # 出现其它写法的单元格标签(带前缀、缺少 r 属性等)时改用 expat 统计
+        nrows, letters, tail = 0, set(), b''
+        with self.archive.open(self.sheet_path) as f:
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                data = tail + chunk
+                end = max(data.rfind(b'<c '), data.rfind(b'<mergeCell ')) if chunk else len(data)
+                if chunk and end <= 0:
+                    if CELL_TAG.search(data):
+                        return self._scan_extent()
+                    tail = data
+                    continue
+                data, tail = data[:end], data[end:]
+                if len(CELL_TAG.findall(data)) != data.count(CANONICAL_CELL):
+                    return self._scan_extent()
+                cells = FILLED_CELL.findall(data)
+                if cells:
+                    nrows = max(nrows, int(cells[-1][1]))
+                    letters.update(column for column, _ in cells)
+                for column, row in MERGE_CELL.findall(data):
+                    nrows = max(nrows, int(row))
+                    letters.add(column)
+                if not chunk:
+                    break
+        return nrows, max((column_index(column.decode()) + 1 for column in letters), default=0)
+
+    def _scan_extent(self):
+        handler = _ExtentHandler()
+        parser = self._parser(handler.start, handler.end, handler.data)
+        with self.archive.open(self.sheet_path) as f:
+            parser.ParseFile(f)
+        return handler.nrows, handler.ncols
+
+    @staticmethod
+    def _parser(start, end, data):
+        parser = expat.ParserCreate(namespace_separator='}')
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = data
+        return parser
+
+    def rows(self):
+        handler = _SheetHandler(self.strings, self.ncols)
+        parser = self._parser(handler.start, handler.end, handler.data)
+        expected = 0
+        with self.archive.open(self.sheet_path) as f:
+            while expected < self.nrows:
+                chunk = f.read(READ_CHUNK_SIZE)
+                parser.Parse(chunk, not chunk)
+                for i, values in handler.done:
+                    if i >= self.nrows:
+                        break
+                    while expected < i:
+                        yield expected, [''] * self.ncols
+                        expected += 1
+                    yield i, values
+                    expected = i + 1
+                handler.done = []
+                if not chunk:
+                    break
+        # 合并单元格可能延伸到最后一行数据之后
+        while expected < self.nrows:
+            yield expected, [''] * self.ncols
+            expected += 1
+
+    def close(self):
+        self.archive.close()
+
+
+def open_reader(file_path):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.xlsx', '.xlsm') and XLSX_READER == 'stream':
+        return XlsxReader(file_path)
+    return XlrdReader(file_path)
@@ -7,6 +7,7 @@ import sys
 
 import pickle
 
+from journal import MatchJournal
 from models import SourceFile, Product, Purchase, Sales, show_progress
 from settings import *
 
@@ -38,7 +39,7 @@ if __name__ == '__main__':
     # ==============商品目录处理===============
     index_sheet = SourceFile('index_new.xls')
     index_sheet.set_header(0)
-    index_sheet.extract_data(model_class=Product)
+    index_sheet.read_items(model_class=Product)
     products = index_sheet.items
     # index_sheet.save_error()
 
@@ -72,7 +73,7 @@ if __name__ == '__main__':
         for year, month, sheet in sales_sheets:
             sheet.set_header(0)
             sheet.set_time(year, month)
-            sheet.extract_data(model_class=Sales)
+            sheet.read_items(model_class=Sales)
             sheet.save_error()
         print("模型生成完成!\n")
 
@@ -89,12 +90,13 @@ if __name__ == '__main__':
     print("\t共有{}条销售数据待处理".format(num_sales))
     show_progress(0, num_sales)
 
+    journal = MatchJournal("sales_list.pickle")
+    journal.replay(sales_list, products)
+
     count = 0
     for i, item in enumerate(sales_list):
         if (i + 1) % 5 == 0:
             show_progress(i + 1, num_sales)
-        if i + 1 > 0 and (i + 1) % 50 == 0:
-            save_data(sales_list, "sales_list.pickle")
 
         if item.processed():
             count += 1
@@ -108,7 +110,12 @@ if __name__ == '__main__':
             no_matches += 1
 
         item.scanned = True
+        journal.record(item)
+        if journal.records >= JOURNAL_COMPACT_EVERY:
+            journal.compact(sales_list)
 
+    journal.compact(sales_list)
+    journal.close()
     print()
     print(count)
 
@@ -9,4 +9,58 @@ SALES_OUT_DIR = os.path.join(EXPORT_ROOT_DIR, '销售导入')
 
 PURCHASE_FILE = "purchase_list.pickle"
 SALES_FILE = "sales_list.pickle"
-PRODUCT_FILE = "index_new.xls"
\ No newline at end of file
+MATCH_CACHE_FILE = "match_cache.pickle"
+MANIFEST_FILE = "source_manifest.pickle"
+METRICS_FILE = "metrics.json"
+PRODUCT_FILE = "index_new.xls"
+# 由 PRODUCT_FILE 编译生成的商品目录(见 catalog.py), index_new.xls 变化时自动重新生成
+CATALOG_FILE = "catalog.compiled"
+
+# 采购/销售数据的存储方式: 'pickle', 'columnar'(按列存储, 见 columnar.py) 或 'sqlite'(见 sqlstore.py)
+STORAGE_BACKEND = 'pickle'
+COLUMNS_SUFFIX = '.columns'
+SQLITE_FILE = "data.sqlite3"
+# SQLite 存储时每个事务写入的匹配结果行数
+SQLITE_BATCH_SIZE = 500
+
+# .xlsx 源文件的读取方式: 'stream'(流式解析, 见 readers.py) 或 'xlrd'; .xls 文件始终使用 xlrd
+XLSX_READER = 'stream'
+
+# 模糊匹配的相似度算法: 'difflib'(SequenceMatcher.ratio) 或 'indel'(位并行 LCS, 见 similarity.py)
+SIMILARITY_KERNEL = 'difflib'
+
+SHORTLIST_SIZE = 200
+INDEX_MAX_DF = 0.25
+
+# 各字段均达到 field, 或整体达到 overall 视为匹配; 整体达到 potential 列为候选
+MATCH_THRESHOLDS = {'field': .7, 'overall': .8, 'potential': .5}
+TFIDF_THRESHOLDS = {'field': .7, 'overall': .8, 'potential': .5}
+TFIDF_TOP_K = 10
+TFIDF_CHUNK_SIZE = 128
+TFIDF_DENSE_DF = 0.02
+
+# 每条未匹配数据保留的候选商品数, 以及每个整理建议文件包含的未匹配数据条数
+SUGGESTION_LIMIT = 10
+SUGGESTION_ITEMS_PER_FILE = 500
+
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_SYNC_EVERY = 100
+JOURNAL_COMPACT_EVERY = 5000
+
+INGEST_WORKERS = 1
+MATCH_WORKERS = 1
+MATCH_CHUNK_SIZE = 50
+EXPORT_WORKERS = 1
+# 导出时同时提交给进程池的分组数上限
+EXPORT_MAX_IN_FLIGHT = 16
+# 流水线(pipeline.py)各阶段之间队列的容量(批次数)和每批数据行数
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_BATCH_SIZE = 500
+
+# 进度条最短刷新间隔(秒); 批量运行时可关闭进度条
+SHOW_PROGRESS = True
+PROGRESS_INTERVAL = 0.5
+
+MATCH_EXACT = 'exact'
+MATCH_NAME_MANUFACTURER = 'name_manufacturer'
+MATCH_FUZZY = 'fuzzy'
@@ -0,0 +1,51 @@
+from collections import Counter
+from difflib import SequenceMatcher
+
+from settings import *
+
+KERNELS = ('difflib', 'indel')
+
+# 相似度计算次数, 在各调用处按算法分别累加:
+#   difflib_ratio: SequenceMatcher.ratio, difflib_quick_ratio: SequenceMatcher.quick_ratio,
+#   indel_ratio: IndelPattern.ratio
+SIMILARITY_CALLS = Counter()
+
+
+# 位并行最长公共子序列(Hyyrö 2004): 模式串每个字符对应一个位掩码, 预先算好后,
+# 与任意文本比较只需对文本逐字符做几次整数运算. Python 整数不限位数, 模式串长度不受 64 位限制.
+# Indel 相似度 = 2 * LCS / (len(a) + len(b)), 即 1 - 只允许插入/删除的编辑距离 / 总长度;
+# SequenceMatcher.ratio() 的匹配块是贪心找到的公共子序列, 因此不会超过 Indel 相似度.
+class IndelPattern:
+
+    __slots__ = ('text', 'masks', 'full')
+
+    def __init__(self, text):
+        self.text = text
+        self.masks = {}
+        for i, char in enumerate(text):
+            self.masks[char] = self.masks.get(char, 0) | (1 << i)
+        self.full = (1 << len(text)) - 1
+
+    def lcs(self, other):
+        get, full = self.masks.get, self.full
+        s = full
+        for char in other:
+            match = get(char)
+            if match:
+                u = s & match
+                s = ((s + u) | (s - u)) & full
+        return len(self.text) - bin(s).count('1')
+
+    def ratio(self, other):
+        total = len(self.text) + len(other)
+        if not total:
+            return 1.0
+        return 2.0 * self.lcs(other) / total
+
+
+def string_similarity(s1, s2, kernel=SIMILARITY_KERNEL):
+    if kernel == 'indel':
+        SIMILARITY_CALLS['indel_ratio'] += 1
+        return IndelPattern(s1).ratio(s2)
+    SIMILARITY_CALLS['difflib_ratio'] += 1
+    return SequenceMatcher(None, s1, s2).ratio()
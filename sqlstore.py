@@ -0,0 +1,221 @@
+import json
+import sqlite3
+
+from models import Product, Purchase, Sales
+from settings import *
+
+TABLES = {Purchase: 'purchases', Sales: 'sales'}
+PARTY_FIELDS = {Purchase: 'vendor', Sales: 'client'}
+# 候选商品和错误信息单独保存, 不作为数据表的列
+SKIPPED_SLOTS = ('potential_matches', 'potential_scores', 'errors', '_matchers')
+BOOL_FIELDS = ('scanned', 'unlikely')
+# 确定一行数据来源的字段: 来源文件及其中的行号
+ROW_FIELDS = ('source', 'year', 'month', 'row')
+MATCH_FIELDS = ('serial', 'scanned', 'unlikely', 'match_type', 'match_score', 'difflib_score')
+PRODUCT_FIELDS = ('serial', 'name', 'dose', 'manufacturer')
+
+
+def item_fields(model_class):
+    return [slot for slot in model_class.all_slots() if slot not in SKIPPED_SLOTS]
+
+
+def _period(item):
+    try:
+        return int(item.year) * 12 + int(item.month)
+    except (TypeError, ValueError):
+        return None
+
+
+# SQLite 数据库: 商品目录、采购、销售和候选商品四类表.
+# 数据列不声明类型, 读出的值与写入时类型一致(字符串仍是字符串), 与 pickle 的结果相同.
+# 采购/销售的 id 即在列表中的序号(从 1 开始), 匹配结果按 id 分批更新, 不必重写整张表.
+class SqlStore:
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        # WAL 模式下读写互不阻塞, 其它进程可以同时读取
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_tables()
+
+    def close(self):
+        self.conn.close()
+
+    def _create_tables(self):
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS products (id INTEGER PRIMARY KEY, {})'.format(', '.join(PRODUCT_FIELDS)))
+            self.conn.execute('CREATE INDEX IF NOT EXISTS products_serial ON products (serial)')
+            for model_class, table in TABLES.items():
+                columns = ', '.join('"{}"'.format(field) for field in item_fields(model_class))
+                self.conn.execute('CREATE TABLE IF NOT EXISTS {} (id INTEGER PRIMARY KEY, period, errors, {})'.format(
+                    table, columns))
+                # 旧版本创建的表缺少后来增加的字段时补上
+                present = {row[1] for row in self.conn.execute('PRAGMA table_info({})'.format(table))}
+                for field in item_fields(model_class):
+                    if field not in present:
+                        self.conn.execute('ALTER TABLE {} ADD COLUMN "{}"'.format(table, field))
+                for name, column in (('serial', 'serial'), ('party', PARTY_FIELDS[model_class]),
+                                     ('period', 'period'), ('match_type', 'match_type')):
+                    self.conn.execute('CREATE INDEX IF NOT EXISTS {0}_{1} ON {0} ("{2}")'.format(table, name, column))
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS candidates (tbl TEXT, item_id INTEGER, position INTEGER, score, {}, '
+                'PRIMARY KEY (tbl, item_id, position)) WITHOUT ROWID'.format(', '.join(PRODUCT_FIELDS)))
+
+    # ==============商品目录================
+
+    def catalog_source(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'catalog_sha1'").fetchone()
+        return None if row is None else row[0]
+
+    def save_products(self, products, sha1):
+        with self.conn:
+            self.conn.execute('DELETE FROM products')
+            self.conn.executemany(
+                'INSERT INTO products (id, {}) VALUES (?, ?, ?, ?, ?)'.format(', '.join(PRODUCT_FIELDS)),
+                ((i, *(getattr(p, field) for field in PRODUCT_FIELDS)) for i, p in enumerate(products)))
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('catalog_sha1', ?)", (sha1,))
+
+    # ==============采购/销售================
+
+    def exists(self, model_class):
+        return self.conn.execute('SELECT 1 FROM {} LIMIT 1'.format(TABLES[model_class])).fetchone() is not None
+
+    def save_items(self, items, model_class):
+        # 整体保存: 在一个事务中替换整张表
+        table, fields = TABLES[model_class], item_fields(model_class)
+        with self.conn:
+            self.conn.execute('DELETE FROM {}'.format(table))
+            self.conn.execute('DELETE FROM candidates WHERE tbl = ?', (table,))
+            self.conn.executemany(
+                'INSERT INTO {} (id, period, errors, {}) VALUES ({})'.format(
+                    table, ', '.join('"{}"'.format(field) for field in fields), ', '.join('?' * (len(fields) + 3))),
+                ((i, _period(item), json.dumps(item.errors, ensure_ascii=False) if item.errors is not None else None,
+                  *(getattr(item, field) for field in fields))
+                 for i, item in enumerate(items, start=1)))
+            self._insert_candidates(table, enumerate(items, start=1))
+
+    def _insert_candidates(self, table, rows):
+        self.conn.executemany(
+            'INSERT INTO candidates VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ((table, item_id, position, score,
+              *((None,) * len(PRODUCT_FIELDS) if p is None else (getattr(p, field) for field in PRODUCT_FIELDS)))
+             for item_id, item in rows
+             for position, (p, score) in enumerate(_scored_candidates(item))))
+
+    def row_keys(self, model_class):
+        # 按 id 顺序列出各行的来源, 用于判断表中的行是否与内存中的列表一一对应
+        return self.conn.execute('SELECT {} FROM {} ORDER BY id'.format(
+            ', '.join('"{}"'.format(field) for field in ROW_FIELDS), TABLES[model_class])).fetchall()
+
+    def update_matches(self, rows, model_class):
+        # rows 为 (id, 数据对象); 只更新匹配相关的列和候选商品, 在一个事务中完成
+        table = TABLES[model_class]
+        rows = list(rows)
+        with self.conn:
+            self.conn.executemany(
+                'UPDATE {} SET {} WHERE id = ?'.format(table, ', '.join('"{}" = ?'.format(f) for f in MATCH_FIELDS)),
+                ((*(getattr(item, field) for field in MATCH_FIELDS), item_id) for item_id, item in rows))
+            self.conn.executemany('DELETE FROM candidates WHERE tbl = ? AND item_id = ?',
+                                  ((table, item_id) for item_id, item in rows))
+            self._insert_candidates(table, rows)
+
+    def load_items(self, model_class, matched=None):
+        # matched 为 True/False 时只读取已匹配/未匹配的行(使用 serial 索引)
+        table, fields = TABLES[model_class], item_fields(model_class)
+        where = ''
+        if matched is not None:
+            where = ' WHERE serial IS {}NULL'.format('NOT ' if matched else '')
+        cursor = self.conn.execute('SELECT id, errors, {} FROM {}{} ORDER BY id'.format(
+            ', '.join('"{}"'.format(field) for field in fields), table, where))
+        items, by_id = [], {}
+        for row in cursor:
+            item = model_class()
+            for field, value in zip(fields, row[2:]):
+                setattr(item, field, bool(value) if field in BOOL_FIELDS else value)
+            item.errors = None if row[1] is None else json.loads(row[1])
+            items.append(item)
+            by_id[row[0]] = item
+
+        products = {}
+        cursor = self.conn.execute(
+            'SELECT item_id, score, {} FROM candidates WHERE tbl = ? ORDER BY item_id, position'.format(
+                ', '.join(PRODUCT_FIELDS)), (table,))
+        for row in cursor:
+            item = by_id.get(row[0])
+            if item is None:
+                continue
+            fields = row[2:]
+            if fields[0] is None:
+                product = None
+            else:
+                if fields not in products:
+                    products[fields] = Product(**{f: v for f, v in zip(PRODUCT_FIELDS, fields) if v is not None})
+                product = products[fields]
+            item.potential_matches.append(product)
+            if row[1] is not None:
+                item.potential_scores.append(row[1])
+        return items
+
+
+_STORES = {}
+
+
+def open_store(path=SQLITE_FILE):
+    # 同一进程内共用一个连接
+    if path not in _STORES:
+        _STORES[path] = SqlStore(path)
+    return _STORES[path]
+
+
+def _scored_candidates(item):
+    scores = item.potential_scores
+    if len(scores) != len(item.potential_matches):
+        scores = [None] * len(item.potential_matches)
+    return zip(item.potential_matches, scores)
+
+
+# 与 MatchJournal 接口相同的匹配结果记录: 每 SQLITE_BATCH_SIZE 行在一个事务中写入数据库,
+# 写入后即已保存, 因此不需要日志回放, compact 也不重写整张表.
+# 只更新已有的行, 所以表中的行与 ops_list 不一致时(新数据库、重新读取了源文件)先整体保存一次
+class SqliteMatchLog:
+
+    def __init__(self, store, ops_list, model_class, batch_size=SQLITE_BATCH_SIZE):
+        self.store = store
+        self.model_class = model_class
+        self.batch_size = batch_size
+        if store.row_keys(model_class) != [tuple(getattr(item, field) for field in ROW_FIELDS) for item in ops_list]:
+            store.save_items(ops_list, model_class)
+        self.ids = {id(item): i for i, item in enumerate(ops_list, start=1)}
+        self.buffer = []
+        self.records = 0
+        self.written = 0
+
+    def replay(self, ops_list, products):
+        return set()
+
+    def record(self, item):
+        self.buffer.append((self.ids[id(item)], item))
+        self.records += 1
+        if len(self.buffer) >= self.batch_size:
+            self.sync()
+
+    def sync(self):
+        if self.buffer:
+            self.store.update_matches(self.buffer, self.model_class)
+            self.written += len(self.buffer)
+            self.buffer = []
+
+    def compact(self, ops_list):
+        # 未逐行记录时(auto_save=False)匹配结果只在内存中, 这里一次性分批写入
+        self.sync()
+        if not self.written:
+            rows = list(enumerate(ops_list, start=1))
+            for start in range(0, len(rows), self.batch_size):
+                self.store.update_matches(rows[start:start + self.batch_size], self.model_class)
+        self.records = 0
+
+    def close(self):
+        self.sync()
@@ -0,0 +1,172 @@
+import math
+from collections import Counter
+from difflib import SequenceMatcher
+
+import numpy as np
+
+from settings import *
+from similarity import SIMILARITY_CALLS
+
+
+def char_ngrams(text, sizes=(1, 2, 3)):
+    grams = Counter()
+    for size in sizes:
+        for i in range(len(text) - size + 1):
+            grams[text[i:i + size]] += 1
+    return grams
+
+
+def product_text(item):
+    return "{}{}{}".format(item.name, "" if item.dose is None else item.dose, item.manufacturer)
+
+
+# 字符 n-gram TF-IDF 批量打分: 商品目录按词项倒排存储(相当于 CSC 矩阵),
+# 一批待匹配数据构成 CSR 矩阵, 分块计算两者乘积得到余弦相似度并取 top-k.
+# 高频词项(如"公司")的倒排表很长, 这部分改用稠密矩阵乘法计算.
+class TfidfScorer:
+
+    def __init__(self, products, top_k=TFIDF_TOP_K, chunk_size=TFIDF_CHUNK_SIZE,
+                 dense_df=TFIDF_DENSE_DF):
+        self.products = products
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+
+        documents = [char_ngrams(product_text(product)) for product in products]
+        df = Counter()
+        for grams in documents:
+            df.update(grams.keys())
+        total = len(products)
+        self.vocabulary = {term: i for i, term in enumerate(df)}
+        self.idf = np.empty(len(self.vocabulary))
+        for term, i in self.vocabulary.items():
+            self.idf[i] = math.log((1 + total) / (1 + df[term])) + 1
+
+        indptr, indices, data = self._vectorize(documents)
+        rows = np.repeat(np.arange(total), np.diff(indptr))
+
+        dense_terms = np.array([i for term, i in self.vocabulary.items() if df[term] > total * dense_df],
+                               dtype=np.int64)
+        self.dense_columns = np.full(len(self.vocabulary), -1)
+        self.dense_columns[dense_terms] = np.arange(len(dense_terms))
+        columns = self.dense_columns[indices]
+        is_dense = columns >= 0
+        self.dense = np.zeros((total, len(dense_terms)))
+        self.dense[rows[is_dense], columns[is_dense]] = data[is_dense]
+
+        sparse = ~is_dense
+        rows, indices, data = rows[sparse], indices[sparse], data[sparse]
+        order = np.argsort(indices, kind='stable')
+        self.postings_docs = rows[order]
+        self.postings_weights = data[order]
+        counts = np.bincount(indices, minlength=len(self.vocabulary))
+        self.postings_ptr = np.concatenate(([0], np.cumsum(counts)))
+
+    def _weights(self, grams):
+        terms, values = [], []
+        for term, count in grams.items():
+            i = self.vocabulary.get(term)
+            if i is None:
+                continue
+            terms.append(i)
+            values.append((1 + math.log(count)) * self.idf[i])
+        values = np.array(values, dtype=float)
+        norm = np.sqrt((values ** 2).sum())
+        if norm > 0:
+            values /= norm
+        return terms, values
+
+    def _vectorize(self, documents):
+        indptr, indices, data = [0], [], []
+        for grams in documents:
+            terms, values = self._weights(grams)
+            indices.extend(terms)
+            data.append(values)
+            indptr.append(len(indices))
+        data = np.concatenate(data) if data else np.empty(0)
+        return np.array(indptr), np.array(indices, dtype=np.int64), data
+
+    def similarity(self, a, b):
+        terms_a, values_a = self._weights(char_ngrams(a))
+        terms_b, values_b = self._weights(char_ngrams(b))
+        weights = dict(zip(terms_b, values_b))
+        return float(sum(v * weights.get(t, 0) for t, v in zip(terms_a, values_a)))
+
+    def _scores(self, indptr, indices, data):
+        num_queries, num_docs = len(indptr) - 1, len(self.products)
+        query_rows = np.repeat(np.arange(num_queries), np.diff(indptr))
+        columns = self.dense_columns[indices]
+        is_dense = columns >= 0
+        dense_queries = np.zeros((num_queries, self.dense.shape[1]))
+        dense_queries[query_rows[is_dense], columns[is_dense]] = data[is_dense]
+        dense_scores = dense_queries @ self.dense.T
+
+        sparse = ~is_dense
+        query_rows, indices, data = query_rows[sparse], indices[sparse], data[sparse]
+        starts = self.postings_ptr[indices]
+        lengths = self.postings_ptr[indices + 1] - starts
+        total = lengths.sum()
+        offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        gather = np.arange(total) - offsets + np.repeat(starts, lengths)
+        rows = np.repeat(query_rows, lengths)
+        values = self.postings_weights[gather] * np.repeat(data, lengths)
+        flat = rows * num_docs + self.postings_docs[gather]
+        scores = np.bincount(flat, weights=values, minlength=num_queries * num_docs)
+        return scores.reshape(num_queries, num_docs) + dense_scores
+
+    def top_candidates(self, items):
+        k = min(self.top_k, len(self.products))
+        for start in range(0, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            documents = [char_ngrams(product_text(item)) for item in chunk]
+            scores = self._scores(*self._vectorize(documents))
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, positions in enumerate(best):
+                ranked = positions[np.argsort(-scores[row, positions], kind='stable')]
+                yield chunk[row], [(int(p), float(scores[row, p])) for p in ranked]
+
+    def decide(self, item, candidates, thresholds=TFIDF_THRESHOLDS):
+        # 与 Item.match_product 相同的阈值语义, 候选按 TF-IDF 得分从高到低判定
+        item.clear_suggestions()
+        best = None
+        for position, overall in candidates:
+            product = self.products[position]
+            fields = [
+                self.similarity(str(item.name), str(product.name)),
+                self.similarity(str(item.dose), str(product.dose)),
+                self.similarity(str(item.manufacturer), str(product.manufacturer)),
+            ]
+            if min(fields) >= thresholds['field'] or overall >= thresholds['overall']:
+                item.serial = product.serial
+                item.scanned = True
+                best = product, overall
+                break
+            if overall >= thresholds['potential']:
+                item.add_suggestion(product, overall)
+            else:
+                item.unlikely = True
+            if best is None:
+                best = product, overall
+        if best is None:
+            item.add_suggestion(None, 0)
+            return
+        product, overall = best
+        if not len(item.potential_matches) and not item.has_serial():
+            item.add_suggestion(product, overall)
+        item.match_score = overall
+        SIMILARITY_CALLS['difflib_ratio'] += 1
+        item.difflib_score = SequenceMatcher(None, product_text(item), product_text(product)).ratio()
+
+
+def report_scores(items):
+    pairs = [(item.match_score, item.difflib_score) for item in items
+             if item.match_score is not None and item.difflib_score is not None]
+    if not pairs:
+        return
+    tfidf, difflib = np.array(pairs).T
+    print("TF-IDF 与 SequenceMatcher 得分对比: {}组, 平均 {:.3f} / {:.3f}, 平均差 {:.3f}, 相关系数 {:.3f}\n".format(
+        len(pairs),
+        tfidf.mean(),
+        difflib.mean(),
+        np.abs(tfidf - difflib).mean(),
+        np.corrcoef(tfidf, difflib)[0, 1] if len(pairs) > 1 else 1.0
+    ))
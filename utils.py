@@ -1,13 +1,22 @@
+import hashlib
 import pickle
 import re
 import shutil
-from difflib import SequenceMatcher
-from operator import attrgetter
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from operator import itemgetter
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, NamedStyle
 
-from models import SourceFile, Purchase, Sales, Product, show_progress
+from catalog import compile_catalog, load_compiled_catalog
+from columnar import ColumnStore, OPS_MODELS, columns_path, save_columns, load_columns
+from metrics import METRICS
+from models import STRING_POOLS, SourceFile, Purchase, Sales, Product
+from similarity import string_similarity
+from sqlstore import open_store
 from settings import *
 
 
@@ -30,55 +39,108 @@ def init():
 
 
 def clear_output_dirs():
+    # 只重建导出根目录, 各年份的子目录在写出时按需创建
     print("清理所有导出表...")
-    try:
-        shutil.rmtree(PURCHASE_OUT_DIR)
-        shutil.rmtree(SALES_OUT_DIR)
-    except FileNotFoundError:
-        pass
-    years = ['2015', '2016', '2017']
-    os.mkdir(PURCHASE_OUT_DIR)
-    os.mkdir(SALES_OUT_DIR)
-    for y in years:
-        os.mkdir(os.path.join(PURCHASE_OUT_DIR, y))
-        os.mkdir(os.path.join(SALES_OUT_DIR, y))
+    for path in (PURCHASE_OUT_DIR, SALES_OUT_DIR):
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
     print("清理完成\n")
 
 
+def _is_columnar(file_name):
+    return STORAGE_BACKEND == 'columnar' and file_name in OPS_MODELS
+
+
+def _is_sqlite(file_name):
+    return STORAGE_BACKEND == 'sqlite' and file_name in OPS_MODELS
+
+
+def data_exists(file_name):
+    if _is_sqlite(file_name):
+        return open_store().exists(OPS_MODELS[file_name])
+    if _is_columnar(file_name):
+        return file_exists(columns_path(file_name))
+    return file_exists(file_name)
+
+
 def save_data(data, file_name, silent=True):
     if not silent:
         print("在文件{}中保存数据...".format(file_name))
-    with open(file_name, 'wb') as fout:
-        pickle.dump(data, fout, pickle.HIGHEST_PROTOCOL)
+    if _is_sqlite(file_name):
+        open_store().save_items(data, OPS_MODELS[file_name])
+    elif _is_columnar(file_name):
+        save_columns(data, columns_path(file_name), OPS_MODELS[file_name])
+    else:
+        # 先写临时文件再替换, 写入中途中断不会损坏原文件
+        temp_file = file_name + '.tmp'
+        with open(temp_file, 'wb') as fout:
+            pickle.dump(data, fout, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, file_name)
     if not silent:
         print("保存完成\n")
 
 
 def load_data(file_path, silent=True):
-    try:
-        with open(file_path, "rb") as fin:
-            data = pickle.load(fin)
-    except FileNotFoundError:
-        return None
+    if _is_sqlite(file_path):
+        if not data_exists(file_path):
+            return None
+        data = open_store().load_items(OPS_MODELS[file_path])
+    elif _is_columnar(file_path):
+        data = load_columns(columns_path(file_path))
+        if data is None:
+            return None
+    else:
+        try:
+            with open(file_path, "rb") as fin:
+                data = pickle.load(fin)
+        except FileNotFoundError:
+            return None
     if not silent:
         print("从文件{}中读取数据成功!\n".format(file_path))
     return data
 
 
+def load_ops_columns(target):
+    # 只读取需要的列时使用, 不生成数据对象
+    target_file = PURCHASE_FILE if target == 'purchase' else SALES_FILE
+    return ColumnStore(columns_path(target_file))
+
+
+def migrate_data_files():
+    # 旧版本的数据对象以 __dict__ 保存, 读取时由 Item.__setstate__ 转换, 这里重新保存为新格式
+    for data_file in (PURCHASE_FILE, SALES_FILE):
+        data = load_data(data_file)
+        if data is None:
+            continue
+        print("迁移数据文件{}, 共{}项...".format(data_file, len(data)))
+        save_data(data, data_file)
+    print("迁移完成\n")
+
+
 def _read_product_info():
     index_sheet = SourceFile(PRODUCT_FILE)
     index_sheet.set_header(0)
-    index_sheet.extract_data(model_class=Product)
-    return index_sheet.items
+    return index_sheet.read_items(model_class=Product)
+
+
+def load_catalog(reload=False):
+    # 编译后的目录与 index_new.xls 的指纹一致时直接读取, 否则重新解析并编译
+    source = os.path.join(DATA_ROOT, PRODUCT_FILE)
+    catalog = load_compiled_catalog(CATALOG_FILE)
+    fingerprint = file_fingerprint(source, None if catalog is None else catalog.source)
+    if reload or catalog is None or catalog.source['sha1'] != fingerprint['sha1']:
+        print("编译商品目录{}...".format(PRODUCT_FILE))
+        compile_catalog(_read_product_info(), CATALOG_FILE, fingerprint)
+        catalog = load_compiled_catalog(CATALOG_FILE)
+    if STORAGE_BACKEND == 'sqlite' and open_store().catalog_source() != catalog.source['sha1']:
+        open_store().save_products(catalog.products(), catalog.source['sha1'])
+    return catalog
 
 
 def load_products(reload=False):
     print("读取商品目录...")
-    if not file_exists(PRODUCT_FILE) or reload:
-        products = _read_product_info()
-    else:
-        products = load_data(PRODUCT_FILE, silent=False)
-    print("读取成功!\n")
+    products = load_catalog(reload).products()
+    print("读取成功, 共{}项商品\n".format(len(products)))
     return products
 
 
@@ -118,7 +180,7 @@ def preprocess_sheets():
     return purchase_sheets, sales_sheets
 
 
-def load_ops_list(target='both', reload=False):
+def load_ops_list(target='both', reload=False, workers=INGEST_WORKERS):
     target_texts = {
         "purchase": "采购",
         "sales": "销售",
@@ -126,13 +188,13 @@ def load_ops_list(target='both', reload=False):
     }
     print("正在读取{}数据...".format(target_texts[target]))
     if target == 'both':
-        p, _ = load_ops_list(target='purchase', reload=reload)
-        _, s = load_ops_list(target='sales', reload=reload)
+        p, _ = load_ops_list(target='purchase', reload=reload, workers=workers)
+        _, s = load_ops_list(target='sales', reload=reload, workers=workers)
         return p, s
 
     target_file = PURCHASE_FILE if target == 'purchase' else SALES_FILE
-    if not file_exists(target_file) or reload:
-        data_list = _generate_ops_list(target)
+    if not data_exists(target_file) or reload:
+        data_list = _generate_ops_list(target, workers=workers)
     else:
         from_file = load_data(target_file, silent=False)
         if target == 'purchase':
@@ -143,59 +205,168 @@ def load_ops_list(target='both', reload=False):
     return data_list
 
 
-def _generate_ops_list(target='both'):
+def load_matched_lists():
+    # 导出只需要已匹配的数据; SQLite 存储时按 serial 索引直接查询
+    if STORAGE_BACKEND == 'sqlite':
+        print("正在读取已匹配的采购/销售数据...")
+        return open_store().load_items(Purchase, matched=True), open_store().load_items(Sales, matched=True)
+    p, s = load_ops_list(target='both', reload=False)
+    return [x for x in p if x.has_serial()], [x for x in s if x.has_serial()]
+
+
+def _parse_source_file(job):
+    year, month, sheet, model_class = job
+    start, cpu = time.perf_counter(), time.process_time()
+    sheet.set_header(0)
+    sheet.set_time(year, month)
+    items = list(sheet.extract_data(model_class=model_class))
+    return items, sheet.error_items, time.perf_counter() - start, time.process_time() - cpu
+
+
+def _parse_sheets(jobs, model_class, workers=INGEST_WORKERS):
+    jobs = [(year, month, sheet, model_class) for year, month, sheet in jobs]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_parse_source_file, jobs))
+    else:
+        results = map(_parse_source_file, jobs)
+
+    parsed, timings = [], []
+    for (year, month, sheet, _), (items, error_items, elapsed, cpu) in zip(jobs, results):
+        sheet.error_items = error_items
+        sheet.save_error()
+        parsed.append(items)
+        timings.append((elapsed, sheet.file_name, len(items)))
+        METRICS.record_file(sheet.file_name, len(items), elapsed, cpu)
+
+    if timings:
+        print("各文件解析用时:")
+        for elapsed, file_name, count in sorted(timings, reverse=True):
+            print("\t{:.2f}s\t{}行\t{}".format(elapsed, count, file_name))
+        print()
+    return parsed
+
+
+def file_fingerprint(file_path, previous=None):
+    # 大小和修改时间都未变化时沿用上次的哈希, 否则重新计算内容哈希
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous is not None and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime:
+        fingerprint['sha1'] = previous['sha1']
+        return fingerprint
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            digest.update(block)
+    fingerprint['sha1'] = digest.hexdigest()
+    return fingerprint
+
+
+def source_key(file_path):
+    # 数据行的来源文件, 与清单(MANIFEST_FILE)的键相同
+    return os.path.relpath(file_path, DATA_ROOT)
+
+
+def _build_ops_list(sheets, model_class, target_file, workers=INGEST_WORKERS):
+    # 按(年, 月)排序, 合并后的数据顺序与进程数无关
+    jobs = sorted(sheets, key=lambda job: (int(job[0]), int(job[1]), job[2].file_name))
+    manifest = load_data(MANIFEST_FILE) or {}
+
+    # 未变化的文件直接复用: 优先取数据文件中的对象(保留匹配结果), 其次取清单中缓存的解析结果.
+    # 数据文件中的行按来源文件分组; 旧数据文件没有记录来源, 只在该月仅有一个文件时按(年, 月)对应
+    existing = {}
+    if data_exists(target_file):
+        months = Counter((year, month) for year, month, sheet in jobs)
+        single = {(year, month): source_key(sheet.file_path) for year, month, sheet in jobs
+                  if months[year, month] == 1}
+        for item in load_data(target_file):
+            source = item.source if item.source is not None else single.get((item.year, item.month))
+            if source is not None:
+                existing.setdefault(source, []).append(item)
+
+    results, changed, fingerprints = {}, [], {}
+    for year, month, sheet in jobs:
+        key = source_key(sheet.file_path)
+        entry = manifest.get(key)
+        fingerprints[key] = file_fingerprint(sheet.file_path, entry)
+        if entry is not None and entry['sha1'] == fingerprints[key]['sha1']:
+            results[key] = existing.get(key, entry['items'])
+        else:
+            changed.append((year, month, sheet))
+    print("共{}个文件, 其中{}个为新增或已修改, 需要重新解析\n".format(len(jobs), len(changed)))
+    METRICS.count('source_files_reused', len(jobs) - len(changed))
+
+    for (year, month, sheet), items in zip(changed, _parse_sheets(changed, model_class, workers)):
+        key = source_key(sheet.file_path)
+        manifest[key] = dict(fingerprints[key], items=items)
+        results[key] = items
+    for key, items in results.items():
+        for item in items:
+            item.source = STRING_POOLS['source'].intern(key)
+    for key in list(manifest):
+        if key in fingerprints:
+            manifest[key].update(fingerprints[key])
+        elif not file_exists(os.path.join(DATA_ROOT, key)):
+            del manifest[key]
+    save_data(manifest, MANIFEST_FILE)
+
+    data_list = []
+    for year, month, sheet in jobs:
+        data_list.extend(results[source_key(sheet.file_path)])
+    return data_list
+
+
+def _generate_ops_list(target='both', workers=INGEST_WORKERS):
     p, s = preprocess_sheets()
     purchase_list, sales_list = [], []
 
     if target == 'both' or target == 'purchase':
         print('开始生成购进数据模型...')
-        for year, month, sheet in p:
-            sheet.set_header(0)
-            sheet.set_time(year, month)
-            sheet.extract_data(model_class=Purchase)
-            sheet.save_error()
-            purchase_list += sheet.items
+        purchase_list = _build_ops_list(p, Purchase, PURCHASE_FILE, workers)
         print("模型生成完成!\n")
 
     if target == 'both' or target == 'sales':
         print('开始生成销售数据模型...')
-        for year, month, sheet in s:
-            sheet.set_header(0)
-            sheet.set_time(year, month)
-            sheet.extract_data(model_class=Sales)
-            sheet.save_error()
-            sales_list += sheet.items
+        sales_list = _build_ops_list(s, Sales, SALES_FILE, workers)
         print("模型生成完成!\n")
 
     return purchase_list, sales_list
 
 
-def get_string_similarity(s1, s2):
-    return SequenceMatcher(None, s1, s2).ratio()
+def get_string_similarity(s1, s2, kernel=SIMILARITY_KERNEL):
+    return string_similarity(s1, s2, kernel)
+
+
+purchase_export_headers = ["供应商名称", "商品编码", "品名", "规格", "厂家", "数量", '单价', '金额']
+sales_export_headers = ["客户名称", "商品编码", "品名", "规格", "厂家", "数量", '单价', '金额']
+
+
+def write_rows(path, headers, rows):
+    # 只写模式: 整行追加并直接流式写入文件, 不在内存中保留单元格对象
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet()
+    sheet.append(headers)
+    for row in rows:
+        sheet.append(row)
+    wb.save(path)
 
 
 def write_purchase_sheet(vendor_name, year, data):
     if not data:
         return
-    wb = Workbook()
-    sheet = wb.active
-    headers = ["供应商名称", "商品编码", "品名", "规格", "厂家", "数量", '单价', '金额']
-    for col in range(len(headers)):
-        sheet.cell(row=1, column=col + 1, value=headers[col])
-    current_row = 2
-    for item in data:
-        values = [
-            item.vendor, item.serial,
-            item.name, item.dose, item.manufacturer,
-            item.amount, item.unit_price, item.price
-        ]
-        if not item.amount or not item.unit_price or not item.price:
-            print("时间{}, 第{}行, 信息: {}".format(item.time, item.row, item))
-        for i, val in enumerate(values):
-            sheet.cell(row=current_row, column=i + 1, value=val)
-        current_row += 1
-    path = os.path.join(PURCHASE_OUT_DIR, year, "{}.xlsx".format(vendor_name))
-    wb.save(path)
+
+    def rows():
+        for item in data:
+            if not item.amount or not item.unit_price or not item.price:
+                print("时间{}, 第{}行, 信息: {}".format(item.time, item.row, item))
+            yield [
+                item.vendor, item.serial,
+                item.name, item.dose, item.manufacturer,
+                item.amount, item.unit_price, item.price
+            ]
+    path = os.path.join(PURCHASE_OUT_DIR, str(year), "{}.xlsx".format(vendor_name))
+    write_rows(path, purchase_export_headers, rows())
 
 
 def split(origin, size=20):
@@ -208,82 +379,105 @@ def write_sales_sheet(client_name, year, long_data):
         return
     data_list = split(long_data, size=20)
     for number, data in enumerate(data_list):
-        wb = Workbook()
-        sheet = wb.active
-        headers = ["客户名称", "商品编码", "品名", "规格", "厂家", "数量", '单价', '金额']
-        for col in range(len(headers)):
-            sheet.cell(row=1, column=col + 1, value=headers[col])
-        current_row = 2
-        for item in data:
-            values = [
+        rows = [
+            [
                 item.client, item.serial,
                 item.name, item.dose, item.manufacturer,
                 item.amount, item.unit_price, item.total_price
-            ]
-            for i, val in enumerate(values):
-                sheet.cell(row=current_row, column=i + 1, value=val)
-            current_row += 1
+            ] for item in data
+        ]
         file_name = "{}{}.xlsx".format(client_name[:20], "-{}".format(number) if number > 0 else "")
-        path = os.path.join(SALES_OUT_DIR, year, file_name)
-        wb.save(path)
-
-
-def dump_purchases(vendor_name, purchases):
-    data_5, data_6, data_7 = [], [], []
-    for i, purchase in enumerate(purchases):
-        if purchase.year == '2015':
-            data_5.append(purchase)
-        elif purchase.year == '2016':
-            data_6.append(purchase)
-        else:
-            data_7.append(purchase)
-    write_purchase_sheet(vendor_name, '2015', data_5)
-    write_purchase_sheet(vendor_name, '2016', data_6)
-    write_purchase_sheet(vendor_name, '2017', data_7)
-
-
-def dump_sales(client_name, sales):
-    data_5, data_6, data_7 = [], [], []
-    for i, item in enumerate(sales):
-        if item.year == '2015':
-            data_5.append(item)
-        elif item.year == '2016':
-            data_6.append(item)
-        else:
-            data_7.append(item)
-    write_sales_sheet(client_name, '2015', data_5)
-    write_sales_sheet(client_name, '2016', data_6)
-    write_sales_sheet(client_name, '2017', data_7)
-
-
-def batch_purchases(purchase_list):
-    pl = sorted(purchase_list, key=attrgetter('vendor', 'time'))
-    current_vendor = pl[0].vendor
-    buff = [pl[0]]
-    show_progress(1, len(pl))
-    for i, purchase in enumerate(pl, start=1):
-        if purchase.vendor == current_vendor:
-            buff.append(purchase)
-        else:
-            dump_purchases(current_vendor, buff)
-            current_vendor = purchase.vendor
-            buff = [purchase]
-        show_progress(i + 1, len(pl))
-    dump_purchases(current_vendor, buff)
-
-
-def group_sales(sales_list):
-    sl = sorted(sales_list, key=attrgetter('client', 'time'))
-    current_client = sl[0].client
-    buff = [sl[0]]
-    for i, sale in enumerate(sl, start=1):
-        if sale.client == current_client:
-            buff.append(sale)
-        else:
-            dump_sales(current_client, buff)
-            current_client = sale.client
-            buff = [sale]
-    dump_sales(current_client, buff)
+        path = os.path.join(SALES_OUT_DIR, str(year), file_name)
+        write_rows(path, sales_export_headers, rows)
+
+
+def _export_job(job):
+    # 一个任务包含输出文件名相同的若干组数据, 在同一进程中按原顺序写出
+    write, groups = job
+    for name, year, items in groups:
+        write(name, year, items)
+
+
+def run_exports(jobs, workers=EXPORT_WORKERS, max_in_flight=EXPORT_MAX_IN_FLIGHT):
+    # jobs 为 (导出函数, [(名称, 年份, 数据), ...]) 序列, 边生成边提交;
+    # 同时在途的任务不超过 max_in_flight 个, 内存占用与分组总数无关.
+    # 单个分组失败只记录下来, 不影响其余分组
+    failures = []
+    completed = 0
+
+    def finish(job, error):
+        nonlocal completed
+        completed += 1
+        if error is not None:
+            failures.extend(("{} {}年".format(name, year), repr(error)) for name, year, _ in job[1])
+        if completed % 10 == 0:
+            print("\r已导出{}组".format(completed), end='')
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            in_flight = {}
+            for job in jobs:
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(in_flight.pop(future), future.exception())
+                in_flight[executor.submit(_export_job, job)] = job
+            for future in as_completed(in_flight):
+                finish(in_flight[future], future.exception())
+    else:
+        for job in jobs:
+            try:
+                _export_job(job)
+            except Exception as e:
+                finish(job, e)
+            else:
+                finish(job, None)
+
+    print("\r导出完成, 共{}组{}\n".format(completed, ", {}组失败:".format(len(failures)) if failures else ""))
+    for name, error in sorted(failures):
+        print("\t{}: {}".format(name, error))
+    return failures
+
+
+def partition_by_year(items, field):
+    # 单次遍历按(供应商/客户编码, 年份)分桶, 编码来自字符串池(见 models.StringPool);
+    # 期间键为整数(年 * 12 + 月), 桶内按期间稳定排序, 与原先按 time 字符串排序的结果一致
+    pool = STRING_POOLS[field]
+    periods, buckets = {}, {}
+    for item in items:
+        time_key = item.year, item.month
+        if time_key not in periods:
+            periods[time_key] = int(item.year), int(item.year) * 12 + int(item.month)
+        year, period = periods[time_key]
+        buckets.setdefault((pool.code(getattr(item, field)), year), []).append((period, item))
+    partitions = {}
+    for (code, year), entries in buckets.items():
+        entries.sort(key=itemgetter(0))
+        partitions[pool.values[code], year] = [item for _, item in entries]
+    return partitions
+
+
+def batch_purchases(purchase_list, workers=EXPORT_WORKERS):
+    partitions = partition_by_year(purchase_list, 'vendor')
+    jobs = ((write_purchase_sheet, [(vendor, year, partitions[vendor, year])])
+            for vendor, year in sorted(partitions))
+    return run_exports(jobs, workers)
+
+
+def group_sales(sales_list, workers=EXPORT_WORKERS):
+    partitions = partition_by_year(sales_list, 'client')
+
+    def jobs():
+        # 文件名只取客户名称前 20 个字, 同一年内前缀相同的客户放入同一任务, 保证写出结果确定
+        batch = []
+        for client, year in sorted(partitions, key=lambda key: (key[0][:20], key[1], key[0])):
+            if batch and (client[:20], year) != (batch[-1][0][:20], batch[-1][1]):
+                yield write_sales_sheet, batch
+                batch = []
+            batch.append((client, year, partitions[client, year]))
+        if batch:
+            yield write_sales_sheet, batch
+    return run_exports(jobs(), workers)
 
 
 header_style = NamedStyle(
@@ -311,48 +505,31 @@ def get_attribute(item, data_type, attribute):
         return ""
 
 
-def write_headers(sheet, headers):
-    for col in range(len(headers)):
-        cell = sheet.cell(row=1, column=col + 1)
-        cell.value = headers[col]
-        cell.style = header_style
+def styled_row(sheet, values, style):
+    # 只写模式下带样式的整行; 样式对象在模块中只创建一次, 各工作簿共用
+    row = []
+    for value in values:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.style = style
+        row.append(cell)
+    return row
 
 
-def write_data_row(item, data_type, sheet, row):
-    if data_type == '采购':
-        headers = purchase_headers
-    else:
-        headers = sales_headers
-
-    for col in range(len(headers)):
-        value = get_attribute(item, data_type, headers[col])
-        cell = sheet.cell(row=row, column=col + 1)
-        cell.value = value
-        if data_type != '商品':
-            cell.style = error_style
+def data_row(item, data_type):
+    headers = purchase_headers if data_type == '采购' else sales_headers
+    return [get_attribute(item, data_type, header) for header in headers]
 
 
 def write_match_errors(items, error_type, filename):
-    book = Workbook()
-    sheet = book.active
-    if error_type == '采购':
-        write_headers(sheet, purchase_headers)
-    else:
-        write_headers(sheet, sales_headers)
-    current_row = 2
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    headers = purchase_headers if error_type == '采购' else sales_headers
+    sheet.append(styled_row(sheet, headers, header_style))
     for item in items:
-        write_data_row(item, error_type, sheet, current_row)
-        current_row += 1
-
-        def get_similarity(sug):
-            a = item.get_product_info
-            b = sug.get_product_info
-            return get_string_similarity(a, b)
-        item.potential_matches.sort(key=get_similarity, reverse=True)
-
-        for suggestion in item.potential_matches[:10]:
-            write_data_row(suggestion, '商品', sheet, current_row)
-            current_row += 1
+        sheet.append(styled_row(sheet, data_row(item, error_type), error_style))
+        # 候选在匹配时已按相似度排序并截断, 直接写出
+        for suggestion in item.suggestions():
+            sheet.append(data_row(suggestion, '商品'))
 
     path = os.path.join(ERROR_DIR, filename)
     book.save(path)